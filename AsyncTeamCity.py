@@ -0,0 +1,230 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# asyncio variant of TeamCity.py, all requests share one aiohttp session:
+#   async with AsyncTeamCity(host, token) as teamcity:
+#       projects = await teamcity.list_projects()
+import asyncio
+import json
+import logging
+
+import aiohttp
+
+from TeamCityBase import TeamCityBase
+
+
+class AsyncTeamCity(TeamCityBase):
+    """
+    asyncio variant of TeamCity. Every API method is a coroutine, requests share one
+    aiohttp session whose connector limits the number of open connections. Only the request
+    independent helpers of TeamCityBase are shared with TeamCity.
+
+    async with AsyncTeamCity(host, token) as teamcity:
+        projects = await teamcity.list_projects()
+    """
+    connection_limit = 0
+    session = None
+
+    def __init__(self, host, token, cache=None, metadata_ttl=300, connection_limit=32, timeout=5):
+        super().__init__(host, token, cache, metadata_ttl)
+        self.connection_limit = connection_limit
+        self.timeout = timeout
+        self.session = None
+
+    async def __aenter__(self):
+        self.get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connection_limit, limit_per_host=self.connection_limit)
+            # The timeout applies to connecting and to every read, artifact downloads may take much longer in total
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def call_cache(self, fn, *args):
+        # A disk cache opens, parses and writes files, that must not block the other requests on the event loop
+        if self.cache.directory is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def query_tc_api(self, url):
+        logging.debug("Querying TeamCity API: %s" % url)
+
+        headers = self.get_headers()
+        entry = None
+        if self.cache is not None:
+            key = self.get_cache_key(url)
+            entry = await self.call_cache(self.cache.get, key)
+            if entry is not None:
+                if self.cache.is_fresh(entry, self.get_ttl(url)):
+                    logging.debug("Cache hit: %s" % url)
+                    return json.loads(entry['body']), 200
+                headers.update(self.cache.get_conditional_headers(entry))
+
+        async with self.get_session().get(self.host + url, headers=headers) as r:
+            if r.status == 304 and entry is not None:
+                logging.debug("Not modified: %s" % url)
+                await self.call_cache(self.cache.touch, key, entry)
+                return json.loads(entry['body']), 200
+
+            text = await r.text()
+            logging.debug("Received: %s" % text)
+            if r.status != 200:
+                return None, r.status
+            if self.cache is not None:
+                await self.call_cache(self.cache.store, key, r.headers, text, self.get_ttl(url))
+            return json.loads(text), 200
+
+    async def get_build_id(self, build_type, status='SUCCESS'):
+        build = await self.get_latest_build(build_type, status)
+        if build is None:
+            logging.warning("No builds found for build type %s" % build_type)
+            return None
+        return build['id']
+
+    async def get_latest_build(self, build_type, status='SUCCESS', fields='id,number'):
+        api_result, api_code = await self.query_tc_api(
+            "/app/rest/builds/?locator=buildType:%s,status:%s,count:1&fields=build(%s)" % (build_type, status, fields))
+        if api_result is None or not api_result.get('build'):
+            return None
+        return api_result['build'][0]
+
+    async def iter_builds(self, locator, fields='id,number', page_size=100):
+        url = "/app/rest/builds/?locator=%s,count:%d&fields=nextHref,build(%s)" % (locator, page_size, fields)
+        while url is not None:
+            api_result, api_code = await self.query_tc_api(url)
+            if api_result is None:
+                logging.warning("Could not list builds for locator %s: %d" % (locator, api_code))
+                return
+            for build in api_result.get('build', []):
+                yield build
+
+            url = api_result.get('nextHref')
+            if url is not None:
+                url = self.get_relative_url(url)
+
+    async def list_artifacts(self, project, bt):
+        build_id = await self.get_build_id(bt)
+        if build_id is None:
+            return None
+        api_result, api_code = await self.query_tc_api("/app/rest/builds/id:%s/artifacts" % build_id)
+        if api_result is None or 'file' not in api_result:
+            logging.warning("No artifacts found for build type %s" % bt)
+            return None
+
+        return [a['name'] for a in api_result['file']]
+
+    async def list_projects(self):
+        api_result, api_code = await self.query_tc_api("/app/rest/projects")
+        if api_result is None or 'project' not in api_result:
+            logging.warning("No projects found")
+            return None
+
+        return [p['id'] for p in api_result['project']]
+
+    async def list_subprojects(self, project):
+        api_result, api_code = await self.query_tc_api("/app/rest/projects/id:%s" % project)
+        if api_result is None or 'projects' not in api_result:
+            logging.warning("No projects found for project %s" % project)
+            return None
+        projects = api_result['projects']
+        if 'project' not in projects:
+            logging.warning("No subprojects found for project %s" % project)
+            return None
+
+        ret = [p['id'].split('_')[1] for p in projects['project']]
+        return json.dumps({'project': project, 'subprojects': ret}, sort_keys=True, indent=4, separators=(',', ': '))
+
+    async def list_build_types(self, project):
+        api_result, api_code = await self.query_tc_api("/app/rest/projects/id:%s" % project)
+        if api_result is None or 'buildTypes' not in api_result:
+            logging.warning("No build types found for project %s" % project)
+            return None
+        build_types = api_result['buildTypes']
+        if 'buildType' not in build_types:
+            logging.warning("No build types found for project %s" % project)
+            return None
+
+        return [b['id'] for b in build_types['buildType']]
+
+    async def list_tags(self, project, bt):
+        api_result, api_code = await self.query_tc_api("/app/rest/builds/?locator=buildType:%s,lookupLimit:10" % bt)
+        if api_result is None or 'build' not in api_result:
+            logging.warning("No builds found for build type %s" % bt)
+            return None
+
+        build_hrefs = [self.get_relative_url(b['href']) for b in api_result['build']]
+        results = await asyncio.gather(*[self.query_tc_api(h) for h in build_hrefs])
+        ret = []
+        for api, code in results:
+            if api is None or 'tags' not in api:
+                continue
+            for t in api['tags'].get('tag', []):
+                if len(t['name']) == 40:
+                    ret.append(t['name'])
+        return json.dumps({
+            'project': project,
+            'build_type': bt,
+            'tags': ret},
+            sort_keys=True, indent=4, separators=(',', ': '))
+
+    async def get_artifact(self, project, bt, artifact):
+        build_id = await self.get_build_id(bt)
+
+        url = self.host + "/app/rest/builds/id:%s/artifacts/content/%s" % (build_id, artifact)
+        async with self.get_session().get(url, headers=self.get_headers()) as r:
+            # Check if the request was successful
+            if r.status != 200:
+                raise Exception("%s: %s" % (r.reason, await r.text()))
+
+            return await r.read()
+
+    async def download_artifact(self, project, bt, artifact, path, chunk_size=1024 * 1024):
+        build_id = await self.get_build_id(bt)
+
+        # Stream to disk, artifacts can be several gigabytes
+        url = self.host + "/app/rest/builds/id:%s/artifacts/content/%s" % (build_id, artifact)
+        async with self.get_session().get(url, headers=self.get_headers()) as r:
+            if r.status != 200:
+                raise Exception("%s: %s" % (r.reason, await r.text()))
+
+            size = 0
+            with open(path, 'wb') as f:
+                async for chunk in r.content.iter_chunked(chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+        return size
+
+    async def check_connection(self):
+        try:
+            api_result, status_code = await self.query_tc_api("/app/rest/server")
+            if api_result is None:
+                return False, status_code
+            return True, 200
+        except Exception as e:
+            logging.error("Could not connect to TeamCity: %s" % e)
+            return False, 500
@@ -0,0 +1,169 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Stamps the version information of many projects and worktrees with a process pool.
+# The manifest is a JSON file with a list of jobs, every job takes the arguments of main.py:
+#   {"jobs": [{"name": "Game", "dir": "/work/game", "game": "Game", "template": "version.tpl",
+#              "output": "/work/game/Source/version.h", "manifest": "/work/game/.version-manifest"}]}
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def get_job_arguments(job):
+    """
+    Converts a job from the manifest to the command line arguments of main.py.
+
+    Parameters
+    ----------
+    job : dict
+        The job, keys are the long option names of main.py with '-' or '_'.
+
+    Returns
+    -------
+    list
+        The command line arguments.
+    """
+    argv = []
+    for key, value in job.items():
+        if key == "name" or value is None or value is False:
+            continue
+        argv.append("--" + key.replace("_", "-"))
+        if value is not True:
+            argv.append(str(value))
+    return argv
+
+
+def run_job(job):
+    """
+    Runs a single job and never raises, failures are reported in the result.
+
+    Parameters
+    ----------
+    job : dict
+        The job.
+
+    Returns
+    -------
+    dict
+        The result with the name, status, exit code, duration and version of the job.
+    """
+    import main
+
+    result = {"name": job.get("name", job.get("dir")), "dir": job.get("dir"), "pid": os.getpid()}
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        report = {}
+        exit_code = main.update_version_information(main.parse_arguments(get_job_arguments(job)), report)
+        result.update(report)
+        result["exit_code"] = exit_code
+        if exit_code != 0:
+            result["status"] = "failed"
+        else:
+            result["status"] = "up-to-date" if report.get("up_to_date") else "stamped"
+    except (Exception, SystemExit) as e:
+        # argparse exits on invalid arguments, that must not end the worker
+        logging.error(f"Job {result['name']} failed: {e!r}")
+        result["status"] = "failed"
+        result["exit_code"] = 1
+        result["error"] = repr(e)
+    result["seconds"] = time.perf_counter() - start
+    result["cpu_seconds"] = time.process_time() - start_cpu
+    return result
+
+
+def stamp(jobs, workers=None):
+    """
+    Runs all jobs on a process pool.
+
+    Parameters
+    ----------
+    jobs : list
+        The jobs.
+
+    workers : int, optional
+        The number of worker processes. If not provided, uses the number of cores.
+
+    Returns
+    -------
+    list
+        The results in the order of the jobs.
+    """
+    workers = min(workers or os.cpu_count() or 1, max(1, len(jobs)))
+    logging.info(f"Running {len(jobs)} jobs on {workers} workers")
+
+    results = [None] * len(jobs)
+    # Every job opens its own repository, worktrees of the same repository share nothing but the page cache,
+    # so jobs are not grouped and any idle worker takes the next one
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(logging.getLogger().level,)) as executor:
+        futures = {executor.submit(run_job, job): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                # A worker process died
+                results[index] = {"name": jobs[index].get("name", jobs[index].get("dir")),
+                                  "dir": jobs[index].get("dir"), "status": "failed", "exit_code": 1,
+                                  "error": repr(e)}
+    return results
+
+
+def init_worker(level):
+    logging.basicConfig(level=level, format='[%(asctime)s] [%(levelname)-8s] [%(processName)s] %(message)s')
+
+
+def print_report(results, seconds):
+    print("%-30s %-10s %-14s %10s %10s" % ("job", "status", "version", "seconds", "cpu"))
+    for r in results:
+        print("%-30s %-10s %-14s %10.3f %10.3f" % (
+            str(r["name"])[:30], r["status"], r.get("version", "-"), r.get("seconds", 0.0), r.get("cpu_seconds", 0.0)))
+    failed = sum(1 for r in results if r["status"] == "failed")
+    print(f"{len(results)} jobs, {failed} failed, {seconds:.3f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Stamps the version information of many projects at once')
+    parser.add_argument('manifest', type=str, help='JSON file with the jobs')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the number of cores',
+                        default=None)
+    parser.add_argument('--report', type=str, help='File to write the results to as JSON', default=None)
+    parser.add_argument('--log', type=str, help='Log level', default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] [%(processName)s] %(message)s')
+
+    with open(args.manifest, 'r') as f:
+        manifest = json.load(f)
+    batch_jobs = manifest["jobs"] if isinstance(manifest, dict) else manifest
+
+    batch_start = time.perf_counter()
+    batch_results = stamp(batch_jobs, args.workers)
+    batch_seconds = time.perf_counter() - batch_start
+
+    print_report(batch_results, batch_seconds)
+    if args.report is not None:
+        with open(args.report, 'w') as f:
+            json.dump({"seconds": batch_seconds, "jobs": batch_results}, f, sort_keys=True, indent=4,
+                      separators=(',', ': '))
+    sys.exit(1 if any(r["status"] == "failed" for r in batch_results) else 0)
@@ -0,0 +1,423 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Benchmarks the toolchain on synthetic repositories, configuration files and templates.
+# Results are written as JSON and can be compared with a previous run:
+#   python Benchmark.py --output before.json
+#   python Benchmark.py --output after.json --baseline before.json
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import main
+from Template import Template
+from UnrealConfig import UnrealConfig
+from UnrealLocalization import UnrealLocalization
+from VersionInformation import VersionInformation
+
+ARRAY_OPERATORS = ['+', '-', '.', '!']
+
+
+def create_repository(path, commits, tags):
+    """
+    Creates a git repository with a linear history using git fast-import.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the new repository.
+
+    commits : int
+        The number of commits.
+
+    tags : int
+        The number of version tags, spread evenly over the history.
+    """
+    os.makedirs(path, exist_ok=True)
+    subprocess.run(["git", "init", "-q", path], check=True)
+
+    tag_every = max(1, commits // max(1, tags))
+    stream = []
+    timestamp = 1700000000
+    for i in range(commits):
+        message = f"Commit {i}\n".encode('utf-8')
+        content = f"{i}\n".encode('utf-8')
+        stream.append(b"commit refs/heads/main\n")
+        stream.append(f"mark :{i + 1}\n".encode('utf-8'))
+        stream.append(f"committer Benchmark <benchmark@example.com> {timestamp + i * 60} +0000\n".encode('utf-8'))
+        stream.append(f"data {len(message)}\n".encode('utf-8') + message)
+        if i > 0:
+            stream.append(f"from :{i}\n".encode('utf-8'))
+        stream.append(b"M 644 inline file.txt\n")
+        stream.append(f"data {len(content)}\n".encode('utf-8') + content + b"\n")
+        if tags > 0 and i % tag_every == 0:
+            stream.append(f"reset refs/tags/1.{i // tag_every}.0\nfrom :{i + 1}\n\n".encode('utf-8'))
+
+    subprocess.run(["git", "-C", path, "fast-import", "--quiet"], input=b"".join(stream), check=True)
+    subprocess.run(["git", "-C", path, "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+
+
+def create_ini(path, lines, seed=0):
+    """
+    Creates an Unreal Engine configuration file with sections, comments and array operators.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    lines : int
+        The approximate number of lines.
+
+    seed : int, optional
+        The seed of the random generator.
+    """
+    rng = random.Random(seed)
+    out = [
+        "[/Script/EngineSettings.GeneralProjectSettings]",
+        "ProjectVersion=1.0.0",
+        'ProjectDisplayedTitle=NSLOCTEXT("[/Script/EngineSettings]", "7128E1C24626155EBFD4BB8085E662B0", "Game")',
+        "",
+        "[CrashReportClient]",
+        "CrashReportClientVersion=1.0.0-0",
+        "",
+    ]
+    section = 0
+    while len(out) < lines:
+        out.append(f"[/Script/Module{section}.Settings{section}]")
+        for key in range(rng.randint(5, 50)):
+            roll = rng.random()
+            if roll < 0.1:
+                out.append(f"; Comment {section}.{key}")
+            elif roll < 0.4:
+                operator = rng.choice(ARRAY_OPERATORS)
+                out.append(f"{operator}Array{key % 5}=(Name=\"Item{key}\",Value={rng.randint(0, 1000)})")
+            else:
+                out.append(f"Key{key}={rng.random()}")
+        out.append("")
+        section += 1
+
+    with open(path, 'w') as f:
+        f.write("\n".join(out) + "\n")
+
+
+def create_template(path, variables):
+    """
+    Creates a template using the variables of main.py and additional generated variables.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    variables : int
+        The number of generated variables.
+
+    Returns
+    -------
+    dict
+        The generated variables and their values.
+    """
+    lines = ["#pragma once", ""]
+    for name in ["changelist", "branch", "visibility", "versionShort", "version", "isPublic"]:
+        lines.append(f'#define VERSION_{name.upper()} "{{{{{name}}}}}"')
+    values = {}
+    for i in range(variables):
+        lines.append(f'#define GENERATED_{i} "{{{{ variable{i} }}}}"')
+        values[f"variable{i}"] = f"value{i}"
+
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return values
+
+
+class Benchmark:
+    """
+    A class used to run benchmarks and to compare their results with a previous run.
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+        the directory the synthetic data is created in
+
+    repeat : int
+        the number of timed runs per benchmark
+
+    results : list
+        the results of all benchmarks
+
+    Methods
+    -------
+    measure(name, params, function, setup=None):
+        Runs a benchmark and records its median time and peak memory.
+
+    run(commits, ini_lines, variables):
+        Runs all benchmarks.
+
+    compare(baseline, threshold):
+        Returns the benchmarks that got slower than the baseline.
+    """
+    def __init__(self, directory, repeat=5):
+        """
+        Constructs a new Benchmark object.
+
+        Parameters
+        ----------
+        directory : str
+            The directory the synthetic data is created in.
+
+        repeat : int, optional
+            The number of timed runs per benchmark.
+        """
+        self.directory = directory
+        self.repeat = repeat
+        self.results = []
+
+    def measure(self, name, params, function, setup=None):
+        """
+        Runs a benchmark and records its median time and peak memory.
+
+        Parameters
+        ----------
+        name : str
+            The name of the benchmark.
+
+        params : dict
+            The parameters of the synthetic data.
+
+        function : callable
+            The code to measure, called with the result of setup.
+
+        setup : callable, optional
+            Called before every run, its time is not measured.
+
+        Returns
+        -------
+        dict
+            The result.
+        """
+        times = []
+        for _ in range(self.repeat):
+            argument = setup() if setup is not None else None
+            start = time.perf_counter()
+            function(argument)
+            times.append(time.perf_counter() - start)
+
+        # Tracing allocations slows everything down, so memory is measured in a separate run
+        argument = setup() if setup is not None else None
+        tracemalloc.start()
+        function(argument)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        result = {
+            'name': name,
+            'params': params,
+            'seconds': statistics.median(times),
+            'min_seconds': min(times),
+            'max_seconds': max(times),
+            'peak_memory_kb': peak / 1024
+        }
+        logging.info(f"{name} {params}: {result['seconds'] * 1000:.2f} ms, {result['peak_memory_kb']:.1f} KiB")
+        self.results.append(result)
+        return result
+
+    def run(self, commits, ini_lines, variables):
+        """
+        Runs all benchmarks.
+
+        Parameters
+        ----------
+        commits : list
+            The commit counts of the synthetic repositories.
+
+        ini_lines : list
+            The line counts of the synthetic configuration files.
+
+        variables : list
+            The variable counts of the synthetic templates.
+
+        Returns
+        -------
+        list
+            The results.
+        """
+        for count in commits:
+            repository = os.path.join(self.directory, f"repo-{count}")
+            create_repository(repository, count, max(1, count // 100))
+            self.measure("GitVersion", {'commits': count}, lambda _: VersionInformation(repository))
+
+        for count in ini_lines:
+            path = os.path.join(self.directory, f"config-{count}.ini")
+            create_ini(path, count)
+            self.measure("UnrealConfig.load", {'lines': count}, lambda _: UnrealConfig(path))
+            config = UnrealConfig(path)
+            self.measure("UnrealConfig.save", {'lines': count}, lambda _: config.save())
+
+        title = UnrealConfig(os.path.join(self.directory, f"config-{ini_lines[0]}.ini")).get(
+            "/Script/EngineSettings.GeneralProjectSettings", "ProjectDisplayedTitle")
+        self.measure("UnrealLocalization.parse", {'strings': 10000},
+                     lambda _: [UnrealLocalization(title) for _ in range(10000)])
+
+        for count in variables:
+            path = os.path.join(self.directory, f"template-{count}.tpl")
+            values = create_template(path, count)
+
+            def setup():
+                template = Template(path)
+                template.set_variables(values)
+                return template
+            self.measure("Template.replace", {'variables': count}, lambda template: template.replace(), setup)
+
+        self.measure_main(commits[-1], ini_lines[-1], variables[0])
+        return self.results
+
+    def measure_main(self, commits, ini_lines, variables):
+        """
+        Measures the whole main.py flow on a synthetic project.
+
+        Parameters
+        ----------
+        commits : int
+            The commit count of the repository.
+
+        ini_lines : int
+            The line count of the configuration files.
+
+        variables : int
+            The variable count of the template.
+        """
+        project = os.path.join(self.directory, "project")
+        create_repository(project, commits, max(1, commits // 100))
+        os.makedirs(os.path.join(project, "Config"), exist_ok=True)
+        create_ini(os.path.join(project, "Config", "DefaultGame.ini"), ini_lines)
+        create_ini(os.path.join(project, "Config", "CrashReportClient.ini"), ini_lines, seed=1)
+        template = os.path.join(project, "version.tpl")
+        create_template(template, variables)
+
+        arguments = ["--dir", project, "--game", "Benchmark", "--template", template,
+                     "--output", os.path.join(project, "version.h"),
+                     "--crash-report-client", os.path.join(project, "Config", "CrashReportClient.ini")]
+        params = {'commits': commits, 'lines': ini_lines, 'variables': variables}
+        self.measure("main", params, lambda _: main.update_version_information(main.parse_arguments(arguments)))
+
+    def compare(self, baseline, threshold=0.2):
+        """
+        Returns the benchmarks that are slower than in the baseline by more than the threshold.
+
+        Parameters
+        ----------
+        baseline : list
+            The results of a previous run.
+
+        threshold : float, optional
+            The allowed relative slowdown, 0.2 means 20%.
+
+        Returns
+        -------
+        list
+            The regressions with the name, params, baseline and current time.
+        """
+        previous = {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in baseline}
+        regressions = []
+        for result in self.results:
+            before = previous.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+            if before is None:
+                continue
+            change = result['seconds'] / before['seconds'] - 1 if before['seconds'] > 0 else 0.0
+            result['change'] = change
+            if change > threshold:
+                regressions.append({'name': result['name'], 'params': result['params'],
+                                    'baseline_seconds': before['seconds'], 'seconds': result['seconds'],
+                                    'change': change})
+        return regressions
+
+
+def parse_counts(value):
+    return [int(v) for v in value.split(',') if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the toolchain on synthetic data')
+    parser.add_argument('--commits', type=parse_counts, help='Commit counts of the repositories',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--ini-lines', type=parse_counts, help='Line counts of the configuration files',
+                        default=[100, 1000, 10000, 100000])
+    parser.add_argument('--variables', type=parse_counts, help='Variable counts of the templates',
+                        default=[10, 100, 1000])
+    parser.add_argument('--repeat', type=int, help='Timed runs per benchmark', default=5)
+    parser.add_argument('--output', type=str, help='File to write the results to as JSON', default=None)
+    parser.add_argument('--baseline', type=str, help='Results of a previous run to compare with', default=None)
+    parser.add_argument('--threshold', type=float, help='Allowed relative slowdown against the baseline',
+                        default=0.2)
+    parser.add_argument('--keep', action='store_true', help='Do not delete the synthetic data')
+    parser.add_argument('--log', type=str, help='Log level', default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    data_directory = tempfile.mkdtemp(prefix="uebuildtools-benchmark-")
+    benchmark = Benchmark(data_directory, args.repeat)
+    try:
+        # main.py logs every step, that would drown the results
+        logging.getLogger().setLevel(max(logging.getLogger().level, logging.WARNING))
+        benchmark.run(args.commits, args.ini_lines, args.variables)
+        logging.getLogger().setLevel(args.log)
+    finally:
+        if args.keep:
+            logging.info(f"Synthetic data kept in {data_directory}")
+        else:
+            shutil.rmtree(data_directory, ignore_errors=True)
+
+    found_regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            found_regressions = benchmark.compare(json.load(f)['results'], args.threshold)
+
+    print(f"{'benchmark':<26} {'params':<45} {'median ms':>10} {'peak KiB':>10} {'change':>8}")
+    for r in benchmark.results:
+        change = f"{r['change'] * 100:+.1f}%" if 'change' in r else "-"
+        params = json.dumps(r['params'], sort_keys=True)
+        print(f"{r['name']:<26} {params:<45} {r['seconds'] * 1000:>10.2f} {r['peak_memory_kb']:>10.1f} {change:>8}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': benchmark.results,
+                'regressions': found_regressions
+            }, f, sort_keys=True, indent=4, separators=(',', ': '))
+
+    for regression in found_regressions:
+        logging.error(f"Regression: {regression['name']} {regression['params']} "
+                      f"{regression['baseline_seconds'] * 1000:.2f} ms -> {regression['seconds'] * 1000:.2f} ms")
+    sys.exit(1 if found_regressions else 0)
@@ -0,0 +1,351 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Records the inputs and outputs of a run so unchanged runs can be skipped.
+# Only reads files, git is not started for the check.
+import hashlib
+import json
+import logging
+import os
+
+
+def get_git_dir(repo_dir):
+    """
+    Returns the git directory and the common git directory of a repository or worktree.
+
+    Parameters
+    ----------
+    repo_dir : str
+        The path to the working tree.
+
+    Returns
+    -------
+    tuple
+        The git directory and the common git directory.
+    """
+    git_dir = os.path.join(repo_dir, '.git')
+    if os.path.isfile(git_dir):
+        # Worktrees and submodules contain a file pointing to the real git directory
+        with open(git_dir, 'r') as f:
+            content = f.read().strip()
+        if content.startswith('gitdir:'):
+            git_dir = os.path.normpath(os.path.join(repo_dir, content[len('gitdir:'):].strip()))
+
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, 'r') as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    return git_dir, common_dir
+
+
+def resolve_ref(common_dir, ref):
+    """
+    Resolves a ref to a SHA using the loose ref files and packed-refs.
+
+    Parameters
+    ----------
+    common_dir : str
+        The common git directory.
+
+    ref : str
+        The ref to resolve, e.g. 'refs/heads/main'.
+
+    Returns
+    -------
+    str or None
+        The SHA the ref points to, or None if it does not exist.
+    """
+    path = os.path.join(common_dir, ref)
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            return f.read().strip()
+
+    packed_refs = os.path.join(common_dir, 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    return None
+
+
+def get_tags(common_dir):
+    """
+    Returns all tags using the loose ref files and packed-refs, without starting git.
+
+    Parameters
+    ----------
+    common_dir : str
+        The common git directory.
+
+    Returns
+    -------
+    dict
+        The SHA of every tag and the commit it peels to, or None if the tag may be annotated and
+        packed-refs does not record what it peels to.
+    """
+    tags = {}
+    packed_refs = os.path.join(common_dir, 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'r') as f:
+            peeled = False
+            name = None
+            for line in f:
+                if line.startswith('#'):
+                    # With the peeled trait every annotated tag is followed by a ^<commit> line
+                    traits = line.split(':', 1)[-1].split()
+                    peeled = 'peeled' in traits or 'fully-peeled' in traits
+                elif line.startswith('^'):
+                    if name is not None:
+                        tags[name] = (tags[name][0], line[1:].strip())
+                else:
+                    parts = line.split()
+                    name = None
+                    if len(parts) == 2 and parts[1].startswith('refs/tags/'):
+                        name = parts[1][len('refs/tags/'):]
+                        tags[name] = (parts[0], parts[0] if peeled else None)
+
+    # Loose refs take precedence over packed-refs
+    tags_dir = os.path.join(common_dir, 'refs', 'tags')
+    for root, dirs, files in os.walk(tags_dir):
+        for file in files:
+            path = os.path.join(root, file)
+            with open(path, 'r') as f:
+                tags[os.path.relpath(path, tags_dir).replace(os.sep, '/')] = (f.read().strip(), None)
+    return tags
+
+
+def get_git_state(repo_dir):
+    """
+    Returns a fingerprint of HEAD and the tags of a repository.
+
+    Parameters
+    ----------
+    repo_dir : str
+        The path to the working tree.
+
+    Returns
+    -------
+    dict
+        The HEAD content, the resolved SHA and a hash over all tag refs.
+    """
+    git_dir, common_dir = get_git_dir(repo_dir)
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as f:
+        head = f.read().strip()
+    sha = head
+    if head.startswith('ref:'):
+        sha = resolve_ref(common_dir, head[len('ref:'):].strip())
+
+    refs = hashlib.sha256()
+    packed_refs = os.path.join(common_dir, 'packed-refs')
+    if os.path.isfile(packed_refs):
+        with open(packed_refs, 'rb') as f:
+            refs.update(f.read())
+    tags_dir = os.path.join(common_dir, 'refs', 'tags')
+    for root, dirs, files in os.walk(tags_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            refs.update(os.path.relpath(path, tags_dir).encode('utf-8'))
+            with open(path, 'rb') as f:
+                refs.update(f.read())
+
+    return {'head': head, 'sha': sha, 'refs': refs.hexdigest()}
+
+
+def get_file_hash(path):
+    """
+    Returns the SHA-256 of a file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    str
+        The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_file_state(path):
+    """
+    Returns the size, modification time and hash of a file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    dict or None
+        The state of the file, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': get_file_hash(path)}
+
+
+class BuildManifest:
+    """
+    A class used to record the inputs and outputs of a run and to check whether they changed since.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the path to the manifest file
+
+    manifest : dict
+        the recorded git state, arguments and file states
+
+    Methods
+    -------
+    load():
+        Loads the manifest from the file.
+
+    is_up_to_date(repo_dir, arguments, files):
+        Returns True if nothing changed since the manifest was recorded.
+
+    record(repo_dir, arguments, files):
+        Records the current git state, arguments and file states.
+
+    save():
+        Saves the manifest to the file.
+    """
+    def __init__(self, path):
+        """
+        Constructs a new BuildManifest object.
+
+        Parameters
+        ----------
+        path : str
+            The path to the manifest file.
+        """
+        self.path = path
+        self.manifest = self.load()
+
+    def load(self):
+        """
+        Loads the manifest from the file.
+
+        Returns
+        -------
+        dict or None
+            The manifest, or None if the file does not exist or is invalid.
+        """
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_up_to_date(self, repo_dir, arguments, files):
+        """
+        Returns True if the git state, the arguments and all files match the manifest.
+        Files are only hashed if their size or modification time changed.
+
+        Parameters
+        ----------
+        repo_dir : str
+            The path to the git repository.
+
+        arguments : dict
+            The arguments of the run.
+
+        files : list
+            The input and output files of the run.
+
+        Returns
+        -------
+        bool
+            True if nothing changed, False otherwise.
+        """
+        if self.manifest is None:
+            logging.debug(f"No manifest found at {self.path}")
+            return False
+        if self.manifest.get('arguments') != arguments:
+            logging.debug("Arguments changed")
+            return False
+        if sorted(self.manifest.get('files', {})) != sorted(files):
+            logging.debug("Files changed")
+            return False
+        try:
+            if self.manifest.get('git') != get_git_state(repo_dir):
+                logging.debug("Git state changed")
+                return False
+        except OSError as e:
+            logging.debug(f"Could not read git state: {e}")
+            return False
+
+        for path, recorded in self.manifest['files'].items():
+            if recorded is None:
+                if os.path.exists(path):
+                    logging.debug(f"{path} was created")
+                    return False
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                logging.debug(f"{path} is missing")
+                return False
+            if stat.st_size == recorded['size'] and stat.st_mtime_ns == recorded['mtime_ns']:
+                continue
+            if stat.st_size != recorded['size'] or get_file_hash(path) != recorded['sha256']:
+                logging.debug(f"{path} changed")
+                return False
+        return True
+
+    def record(self, repo_dir, arguments, files):
+        """
+        Records the current git state, arguments and file states.
+
+        Parameters
+        ----------
+        repo_dir : str
+            The path to the git repository.
+
+        arguments : dict
+            The arguments of the run.
+
+        files : list
+            The input and output files of the run.
+        """
+        self.manifest = {
+            'arguments': arguments,
+            'git': get_git_state(repo_dir),
+            'files': {path: get_file_state(path) for path in files}
+        }
+
+    def save(self):
+        """
+        Saves the manifest to the file.
+        """
+        with open(self.path, 'w') as f:
+            json.dump(self.manifest, f, sort_keys=True, indent=4, separators=(',', ': '))
@@ -0,0 +1,306 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Derives the build component of the version from the commit history.
+#   commits:      commits since the nearest version tag, like git describe
+#   first-parent: number of commits on the first-parent chain of HEAD, never decreases on a mainline branch
+# The previous result is cached in the git directory, the next run only walks the commits added since then.
+import hashlib
+import json
+import logging
+import os
+import re
+
+from BuildManifest import get_git_dir
+from Trace import span
+
+MODES = ('tag', 'commits', 'first-parent')
+VERSION_TAG_PATTERN = re.compile(r'^\d+\.\d+\.\d+')
+VERSION_TAG_GLOB = '[0-9]*.[0-9]*.[0-9]*'
+CACHE_FILE = 'uebuildtools-build-number.json'
+
+
+class BuildNumber:
+    """
+    A class used to count commits for the build component of the version.
+
+    ...
+
+    Attributes
+    ----------
+    git : git.cmd.Git
+        the git command wrapper of the open repository
+
+    mode : str
+        'commits' or 'first-parent'
+
+    cache_path : str
+        the file the previous result is cached in, or None to disable the cache
+
+    commit_graph : bool
+        whether a missing commit-graph is written before the history is walked
+
+    Methods
+    -------
+    get(head):
+        Returns the nearest version tag and the build number of a commit.
+
+    get_version_tags():
+        Returns the commits carrying a version tag and a digest of all version tags.
+
+    has_commit_graph():
+        Returns True if the repository has a commit-graph file.
+
+    write_commit_graph():
+        Writes the commit-graph file used to speed up history walks.
+    """
+    def __init__(self, git, repo_dir, mode='commits', cache=True, commit_graph=False):
+        """
+        Constructs a new BuildNumber object.
+
+        Parameters
+        ----------
+        git : git.cmd.Git
+            The git command wrapper of the open repository.
+
+        repo_dir : str
+            The path to the working tree.
+
+        mode : str, optional
+            'commits' or 'first-parent'.
+
+        cache : bool, optional
+            Whether the previous result is cached in the git directory.
+
+        commit_graph : bool, optional
+            Whether a missing commit-graph is written before the history is walked.
+        """
+        if mode not in MODES[1:]:
+            raise Exception(f"Unknown build number mode: {mode}")
+        self.git = git
+        self.mode = mode
+        self.git_dir, self.common_dir = get_git_dir(repo_dir)
+        self.cache_path = os.path.join(self.git_dir, CACHE_FILE) if cache else None
+        self.commit_graph = commit_graph
+
+    def get(self, head):
+        """
+        Returns the nearest version tag and the build number of a commit. Uses the cached result of the
+        previous run if HEAD descends from it and no version tag was added since, then only the new commits
+        are counted.
+
+        Parameters
+        ----------
+        head : str
+            The SHA of the commit.
+
+        Returns
+        -------
+        tuple
+            The nearest version tag, or None if there is none, and the build number.
+        """
+        tagged, digest = self.get_version_tags()
+        previous = self.load_cache()
+        result = None
+        if previous is not None and previous['tags'] == digest:
+            if previous['head'] == head:
+                logging.debug(f"Build number of {head} is cached: {previous['count']}")
+                return previous['tag'], previous['count']
+            result = self.update(previous, head, tagged)
+
+        if result is None:
+            if self.commit_graph and not self.has_commit_graph():
+                self.write_commit_graph()
+            elif not self.has_commit_graph():
+                logging.info("No commit-graph found, counting commits on a large history is faster after "
+                             "'git commit-graph write --reachable' or with --write-commit-graph")
+            result = self.count(head)
+
+        tag, count = result
+        logging.debug(f"Build number of {head}: {count} (tag: {tag}, mode: {self.mode})")
+        self.save_cache({'head': head, 'tags': digest, 'tag': tag, 'count': count})
+        return tag, count
+
+    def count(self, head):
+        """
+        Counts the build number of a commit by walking its history.
+
+        Parameters
+        ----------
+        head : str
+            The SHA of the commit.
+
+        Returns
+        -------
+        tuple
+            The nearest version tag, or None if there is none, and the build number.
+        """
+        with span("git describe --long", "git"):
+            status, out, _ = self.git.describe("--tags", "--long", f"--match={VERSION_TAG_GLOB}", head,
+                                               with_exceptions=False, with_extended_output=True)
+        # <tag>-<commits since tag>-g<sha>, tags may contain dashes themselves
+        match = re.match(r'^(.*)-(\d+)-g[0-9a-f]+$', out) if status == 0 else None
+        tag = match.group(1) if match else None
+
+        if self.mode == 'first-parent':
+            with span("git rev-list --count --first-parent", "git"):
+                return tag, int(self.git.rev_list("--count", "--first-parent", head))
+        if match:
+            return tag, int(match.group(2))
+        # No version tag yet, every commit counts
+        with span("git rev-list --count", "git"):
+            return None, int(self.git.rev_list("--count", head))
+
+    def update(self, previous, head, tagged):
+        """
+        Adds the commits since the previous result to its build number.
+
+        Parameters
+        ----------
+        previous : dict
+            The cached result of the previous run.
+
+        head : str
+            The SHA of the commit.
+
+        tagged : set
+            The commits carrying a version tag.
+
+        Returns
+        -------
+        tuple or None
+            The nearest version tag and the build number, or None if the history has to be walked again.
+        """
+        if self.mode == 'first-parent':
+            # Only valid if the previous HEAD is on the first-parent chain, e.g. not after merging a feature branch
+            with span("git rev-list --first-parent --parents", "git"):
+                status, out, _ = self.git.rev_list("--first-parent", "--parents", f"{previous['head']}..{head}",
+                                                   with_exceptions=False, with_extended_output=True)
+            lines = out.splitlines() if status == 0 else []
+            if not lines or lines[-1].split()[1:2] != [previous['head']]:
+                return None
+            commits = [line.split()[0] for line in lines]
+            # A merged branch may carry a version tag that is nearer than the cached one, describe would find it
+            reachable = commits
+            if any(len(line.split()) > 2 for line in lines):
+                with span("git rev-list", "git"):
+                    reachable = self.git.rev_list(f"{previous['head']}..{head}").splitlines()
+        else:
+            with span("git merge-base --is-ancestor", "git"):
+                status, _, _ = self.git.merge_base("--is-ancestor", previous['head'], head,
+                                                   with_exceptions=False, with_extended_output=True)
+            if status != 0:
+                return None
+            # Everything reachable from the previous HEAD is reachable from its tag or counted already
+            with span("git rev-list", "git"):
+                commits = self.git.rev_list(f"{previous['head']}..{head}").splitlines()
+            reachable = commits
+
+        if any(commit in tagged for commit in reachable):
+            # A new version tag is the nearest tag now
+            return None
+        logging.debug(f"Counted {len(commits)} commits since {previous['head']}")
+        return previous['tag'], previous['count'] + len(commits)
+
+    def get_version_tags(self):
+        """
+        Returns the commits carrying a version tag and a digest of all version tags. Only reads the refs,
+        annotated tags are peeled to their commit.
+
+        Returns
+        -------
+        tuple
+            The set of tagged commit SHAs and the hex digest of the tag names and SHAs.
+        """
+        with span("git for-each-ref", "git"):
+            out = self.git.for_each_ref("--format=%(objectname) %(*objectname) %(refname:strip=2)", "refs/tags")
+        tagged = set()
+        digest = hashlib.sha256()
+        for line in out.splitlines():
+            sha, peeled, name = line.split(' ', 2)
+            if not VERSION_TAG_PATTERN.match(name):
+                continue
+            tagged.add(peeled or sha)
+            digest.update(line.encode('utf-8') + b'\n')
+        return tagged, digest.hexdigest()
+
+    def has_commit_graph(self):
+        """
+        Returns True if the repository has a commit-graph file.
+
+        Returns
+        -------
+        bool
+            True if a single commit-graph file or a commit-graph chain exists.
+        """
+        info = os.path.join(self.common_dir, 'objects', 'info')
+        return (os.path.isfile(os.path.join(info, 'commit-graph')) or
+                os.path.isfile(os.path.join(info, 'commit-graphs', 'commit-graph-chain')))
+
+    def write_commit_graph(self):
+        """
+        Writes or extends the commit-graph file, git reads generation numbers from it instead of
+        parsing every commit object when walking the history.
+        """
+        with span("git commit-graph write", "git"):
+            self.git.commit_graph("write", "--reachable", "--split")
+        logging.info("Wrote commit-graph")
+
+    def load_cache(self):
+        """
+        Returns the cached result of the previous run for the current mode.
+
+        Returns
+        -------
+        dict or None
+            The head, tag digest, tag and count, or None if nothing is cached.
+        """
+        if self.cache_path is None or not os.path.isfile(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f).get(self.mode)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read build number cache {self.cache_path}: {e}")
+            return None
+
+    def save_cache(self, entry):
+        """
+        Stores the result for the current mode, the results of other modes are kept.
+
+        Parameters
+        ----------
+        entry : dict
+            The head, tag digest, tag and count.
+        """
+        if self.cache_path is None:
+            return
+        cache = {}
+        try:
+            if os.path.isfile(self.cache_path):
+                with open(self.cache_path, 'r') as f:
+                    cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        cache[self.mode] = entry
+        try:
+            # Written to a temporary file first, parallel runs must never see a partial file
+            with open(self.cache_path + f'.{os.getpid()}.tmp', 'w') as f:
+                json.dump(cache, f)
+            os.replace(self.cache_path + f'.{os.getpid()}.tmp', self.cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write build number cache {self.cache_path}: {e}")
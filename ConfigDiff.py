@@ -0,0 +1,269 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Compares the configuration values of two branches, tags or commits section by section and key by key:
+#   python ConfigDiff.py --dir /work/game main release/1.4 --output drift.json
+# git compares the trees first, files with the same blob on both sides are never read or parsed.
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from GitBlobSource import GitBlobSource
+from Trace import span
+from UnrealConfig import UnrealConfig
+
+NULL_SHA = '0' * 40
+# Below this number of changed files starting worker processes takes longer than parsing them
+PARALLEL_THRESHOLD = 8
+
+worker_source = None
+
+
+def get_changed_files(source, old, new, paths=None):
+    """
+    Returns the configuration files that differ between two commits.
+
+    Parameters
+    ----------
+    source : GitBlobSource
+        The repository.
+
+    old : str
+        The SHA of the old commit.
+
+    new : str
+        The SHA of the new commit.
+
+    paths : list, optional
+        Directories to compare, e.g. ['Config']. If not provided, all .ini files are compared.
+
+    Returns
+    -------
+    list
+        The path and the status ('added', 'deleted' or 'modified') of every changed file.
+    """
+    pathspecs = [f"{path.strip('/')}/*.ini" for path in paths] if paths else ["*.ini"]
+    with span("git diff-tree", "git"):
+        out = source.repo.git.diff_tree("-r", "-z", "--no-renames", old, new, "--", *pathspecs)
+
+    # :<old mode> <new mode> <old sha> <new sha> <status>\0<path>\0
+    fields = out.split('\0')
+    changed = []
+    for i in range(0, len(fields) - 1, 2):
+        _, _, old_sha, new_sha, _ = fields[i].split(' ')
+        if old_sha == NULL_SHA:
+            status = 'added'
+        elif new_sha == NULL_SHA:
+            status = 'deleted'
+        else:
+            status = 'modified'
+        changed.append((fields[i + 1], status))
+    return changed
+
+
+def get_sections(config):
+    """
+    Returns the values of every section of a configuration file after applying the array operators, so +Key, -Key,
+    .Key and !Key lines are compared as the one array Key they build. Comments are left out.
+
+    Parameters
+    ----------
+    config : UnrealConfig
+        The configuration file.
+
+    Returns
+    -------
+    dict
+        The list of values by key without operator of every section.
+    """
+    return {section: config.get_effective_values(section) for section in config.config}
+
+
+def diff_configs(old, new):
+    """
+    Compares two configurations section by section and key by key. Keys are compared by the values they end up
+    with, an array that is written differently but ends up with the same values is not a change. Comments are ignored.
+
+    Parameters
+    ----------
+    old : dict
+        The old values of every section, see get_sections, empty if the file was added.
+
+    new : dict
+        The new values of every section, see get_sections, empty if the file was deleted.
+
+    Returns
+    -------
+    dict
+        The status ('added', 'deleted' or 'modified') and the changed keys with their old and new list of
+        values of every section that differs.
+    """
+    diff = {}
+    sections = list(old) + [section for section in new if section not in old]
+    for section in sections:
+        old_values = old.get(section, {})
+        new_values = new.get(section, {})
+        keys = {}
+        for key in list(old_values) + [key for key in new_values if key not in old_values]:
+            if old_values.get(key) != new_values.get(key):
+                keys[key] = {'old': old_values.get(key), 'new': new_values.get(key)}
+        if not keys:
+            continue
+        if section not in old:
+            status = 'added'
+        elif section not in new:
+            status = 'deleted'
+        else:
+            status = 'modified'
+        diff[section] = {'status': status, 'keys': keys}
+    return diff
+
+
+def diff_file(old, new, path, status, source=None):
+    """
+    Parses both versions of a file and compares them.
+
+    Parameters
+    ----------
+    old : str
+        The SHA of the old commit.
+
+    new : str
+        The SHA of the new commit.
+
+    path : str
+        The path of the file in the repository.
+
+    status : str
+        'added', 'deleted' or 'modified'.
+
+    source : GitBlobSource, optional
+        The repository. If not provided, uses the one opened by init_worker.
+
+    Returns
+    -------
+    dict
+        The path, status and section diff of the file, or the error if it could not be parsed.
+    """
+    source = source or worker_source
+    result = {'path': path, 'status': status}
+    try:
+        old_sections = get_sections(UnrealConfig(f"{old}:{path}", source)) if status != 'added' else {}
+        new_sections = get_sections(UnrealConfig(f"{new}:{path}", source)) if status != 'deleted' else {}
+        result['sections'] = diff_configs(old_sections, new_sections)
+    except Exception as e:
+        logging.error(f"Could not compare {path}: {e}")
+        result['error'] = str(e)
+    return result
+
+
+def diff_files(args):
+    return [diff_file(*arguments) for arguments in args]
+
+
+def init_worker(repo_dir, level):
+    global worker_source
+
+    logging.basicConfig(level=level, format='[%(asctime)s] [%(levelname)-8s] [%(processName)s] %(message)s')
+    # Every worker talks to its own git cat-file process
+    worker_source = GitBlobSource(repo_dir)
+
+
+def diff_revisions(repo_dir, old, new, paths=None, workers=None):
+    """
+    Compares the configuration files of two branches, tags or commits.
+
+    Parameters
+    ----------
+    repo_dir : str
+        The path to the Git repository.
+
+    old : str
+        The old branch, tag or commit.
+
+    new : str
+        The new branch, tag or commit.
+
+    paths : list, optional
+        Directories to compare, e.g. ['Config']. If not provided, all .ini files are compared.
+
+    workers : int, optional
+        The number of worker processes. If not provided, uses the number of cores.
+
+    Returns
+    -------
+    dict
+        The resolved commits, the number of changed files and the diff of every file whose values differ.
+    """
+    source = GitBlobSource(repo_dir)
+    old_sha = source.repo.git.rev_parse(f"{old}^{{commit}}")
+    new_sha = source.repo.git.rev_parse(f"{new}^{{commit}}")
+    changed = get_changed_files(source, old_sha, new_sha, paths)
+    logging.info(f"{len(changed)} configuration files differ between {old} and {new}")
+
+    tasks = [(old_sha, new_sha, path, status) for path, status in changed]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    with span("diff files", "diff", files=len(tasks), workers=workers):
+        if workers <= 1 or len(tasks) < PARALLEL_THRESHOLD:
+            results = [diff_file(*task, source) for task in tasks]
+        else:
+            # A few large chunks per worker, sending every file on its own costs more than parsing it
+            chunk_size = -(-len(tasks) // (workers * 4))
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(repo_dir, logging.getLogger().level)) as executor:
+                results = [result for chunk in executor.map(diff_files, chunks) for result in chunk]
+
+    return {
+        'old': {'rev': old, 'sha': old_sha},
+        'new': {'rev': new, 'sha': new_sha},
+        'changed_files': len(changed),
+        # Files that only differ in comments or formatting are left out
+        'files': {r.pop('path'): r for r in results if r.get('sections') or r.get('error')}
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compares the configuration values of two branches or commits')
+    parser.add_argument('old', type=str, help='Old branch, tag or commit')
+    parser.add_argument('new', type=str, help='New branch, tag or commit')
+    parser.add_argument('--dir', type=str, help='Git repository directory', required=True)
+    parser.add_argument('--path', type=str, action='append', default=None,
+                        help='Directory to compare, can be given more than once, defaults to all .ini files')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the number of cores',
+                        default=None)
+    parser.add_argument('--output', type=str, help='File to write the diff to, defaults to stdout', default=None)
+    parser.add_argument('--log', type=str, help='Log level', default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] [%(processName)s] %(message)s')
+
+    start = time.perf_counter()
+    config_diff = diff_revisions(args.dir, args.old, args.new, args.path, args.workers)
+    logging.info(f"{len(config_diff['files'])} files with changed values in {time.perf_counter() - start:.3f} seconds")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(config_diff, f, indent=4)
+    else:
+        json.dump(config_diff, sys.stdout, indent=4)
+        print()
+    sys.exit(1 if any('error' in f for f in config_diff['files'].values()) else 0)
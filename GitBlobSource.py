@@ -0,0 +1,227 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Reads files of any commit straight from the object database, without a checkout or worktree:
+#   source = GitBlobSource("/work/game")
+#   config = UnrealConfig("release/1.4:Config/DefaultGame.ini", source)
+# Blobs are cached by SHA, files that are identical on several branches are only read once.
+import argparse
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from Trace import span
+
+
+def split_spec(spec):
+    """
+    Splits a '<tree-ish>:<path>' specification.
+
+    Parameters
+    ----------
+    spec : str
+        The specification, e.g. 'release/1.4:Config/DefaultGame.ini'.
+
+    Returns
+    -------
+    tuple
+        The tree-ish and the path inside the tree.
+    """
+    treeish, separator, path = spec.partition(':')
+    if not separator or not treeish or not path:
+        raise Exception(f"Expected <tree-ish>:<path>, got {spec}")
+    return treeish, path.strip('/')
+
+
+class GitBlobSource:
+    """
+    A class used to read files from the object database of a Git repository.
+
+    ...
+
+    Attributes
+    ----------
+    repo : git.Repo
+        the open repository
+
+    max_bytes : int
+        the maximum size of all cached blobs
+
+    blobs : OrderedDict
+        the cached blob contents by SHA, least recently used first
+
+    Methods
+    -------
+    get_blob_sha(spec):
+        Returns the SHA of the blob a '<tree-ish>:<path>' specification points to.
+
+    read_bytes(spec):
+        Returns the content of a file.
+
+    read(spec):
+        Returns the content of a text file.
+    """
+    def __init__(self, repo_dir, max_bytes=64 * 1024 * 1024):
+        """
+        Constructs a new GitBlobSource object.
+
+        Parameters
+        ----------
+        repo_dir : str
+            The path to the Git repository.
+
+        max_bytes : int, optional
+            The maximum size of all cached blobs.
+        """
+        with span("git open", "git", path=repo_dir):
+            import git
+
+            self.repo = git.Repo(repo_dir)
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.blobs = OrderedDict()
+        self.paths = {}
+        self.hits = 0
+        self.misses = 0
+        # GitPython talks to a single git cat-file process, requests must not interleave
+        self.lock = threading.RLock()
+
+    def get_blob_sha(self, spec):
+        """
+        Returns the SHA of the blob a '<tree-ish>:<path>' specification points to.
+
+        Parameters
+        ----------
+        spec : str
+            The specification, e.g. 'release/1.4:Config/DefaultGame.ini'.
+
+        Returns
+        -------
+        bytes
+            The binary SHA of the blob.
+        """
+        treeish, path = split_spec(spec)
+        with self.lock, span("git resolve", "git", spec=spec):
+            tree = self.repo.tree(treeish)
+            # Trees are immutable, a path in a tree always points to the same blob
+            key = (tree.binsha, path)
+            if key not in self.paths:
+                try:
+                    blob = tree / path
+                except KeyError:
+                    raise Exception(f"{path} does not exist in {treeish}")
+                if blob.type != 'blob':
+                    raise Exception(f"{path} in {treeish} is not a file")
+                self.paths[key] = blob.binsha
+            return self.paths[key]
+
+    def read_bytes(self, spec):
+        """
+        Returns the content of a file.
+
+        Parameters
+        ----------
+        spec : str
+            The specification, e.g. 'release/1.4:Config/DefaultGame.ini'.
+
+        Returns
+        -------
+        bytes
+            The content of the file.
+        """
+        binsha = self.get_blob_sha(spec)
+        with self.lock:
+            data = self.blobs.get(binsha)
+            if data is not None:
+                self.blobs.move_to_end(binsha)
+                self.hits += 1
+                return data
+
+            self.misses += 1
+            with span("git read blob", "git", spec=spec) as args:
+                data = self.repo.odb.stream(binsha).read()
+                args['bytes'] = len(data)
+            if len(data) <= self.max_bytes:
+                self.blobs[binsha] = data
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    self.size -= len(self.blobs.popitem(last=False)[1])
+            return data
+
+    def read(self, spec):
+        """
+        Returns the content of a text file with the line endings a file opened in text mode would have.
+
+        Parameters
+        ----------
+        spec : str
+            The specification, e.g. 'release/1.4:Config/DefaultGame.ini'.
+
+        Returns
+        -------
+        str
+            The content of the file.
+        """
+        return self.read_bytes(spec).decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Prints the version stamp of several branches or tags '
+                                                 'without checking them out')
+    parser.add_argument('revs', nargs='+', help='Branches, tags or commits')
+    parser.add_argument('--dir', type=str, help='Git repository directory', required=True)
+    parser.add_argument('--template', type=str, default=None, help='Template file, relative to the repository')
+    parser.add_argument('--default-game', type=str, default="Config/DefaultGame.ini",
+                        help='DefaultGame.ini file, relative to the repository')
+    parser.add_argument('--build-number', type=str, choices=['tag', 'commits', 'first-parent'], default='tag',
+                        help='Build component of the version, see main.py')
+    parser.add_argument('--log', type=str, help='Log level', default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    # main only loads GitPython once a repository is opened
+    from main import get_template_variables
+    from Template import Template
+    from UnrealConfig import UnrealConfig
+    from VersionInformation import VersionInformation
+
+    source = GitBlobSource(args.dir)
+    stamps = {}
+    for rev in args.revs:
+        version_information = VersionInformation(args.dir, args.build_number, rev=rev)
+        stamp = {
+            'sha': version_information.sha,
+            'branch': version_information.branch,
+            'version': version_information.get_version_long(),
+            'visibility': version_information.get_visibility()
+        }
+        try:
+            config = UnrealConfig(f"{rev}:{args.default_game}", source)
+            stamp['project_version'] = config.get("/Script/EngineSettings.GeneralProjectSettings", "ProjectVersion")
+        except Exception as e:
+            logging.warning(f"{rev}: {e}")
+        if args.template is not None:
+            template = Template(f"{rev}:{args.template}", source)
+            template.set_variables(get_template_variables(version_information))
+            template.replace()
+            stamp['output'] = template.output
+        stamps[rev] = stamp
+
+    logging.info(f"Blob cache: {source.hits} hits, {source.misses} misses")
+    print(json.dumps(stamps, indent=4))
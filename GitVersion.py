@@ -15,10 +15,44 @@
     You should have received a copy of the GNU Affero General Public License
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import json
 import logging
+import os
 import re
 import datetime
-import git
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, concurrent writers only merge the file they read right before replacing it
+    fcntl = None
+
+from BuildManifest import get_tags
+from BuildNumber import BuildNumber
+from Trace import span
+
+VERSION_PATTERN = re.compile(r'(\d+)\.(\d+)\.(\d+)(?:-(\d+))?')
+MAX_SIDECAR_ENTRIES = 1024
+
+
+def parse_version(tag):
+    """
+    Parses a version tag.
+
+    Parameters
+    ----------
+    tag : str
+        The tag, e.g. '1.2.3' or '1.2.3-4'.
+
+    Returns
+    -------
+    list or None
+        The version as [major, minor, patch, build], or None if the tag is not a version.
+    """
+    match = VERSION_PATTERN.match(tag)
+    if not match:
+        return None
+    return [int(match.group(1)), int(match.group(2)), int(match.group(3)), int(match.group(4) or 0)]
 
 
 class GitVersion:
@@ -41,9 +75,24 @@ class GitVersion:
     version : list
         the version number as a list of integers in the format [major, minor, patch, build]
 
+    rev : str
+        the commit the version information is read for, HEAD by default
+
     commit_date : datetime
         the date and time of the current commit
 
+    build_number : BuildNumber
+        counts the build component of the version, or None to take it from the tag
+
+    version_sidecar : str
+        JSON file with precomputed versions per commit and build number mode, or None
+
+    build_number_mode : str
+        'tag', 'commits' or 'first-parent', see the constructor
+
+    shallow : bool
+        whether the repository is a shallow clone
+
     Methods
     -------
     get_datetime():
@@ -57,6 +106,12 @@ class GitVersion:
 
     get_version():
         Retrieves the version number from the latest tag.
+
+    get_exact_tag():
+        Returns the highest version tag pointing at the current commit.
+
+    refresh():
+        Reads all version information again using the open repository.
     """
     branch = ""
     sha = ""
@@ -64,7 +119,7 @@ class GitVersion:
     version = [0, 0, 0]
     commit_date = None
 
-    def __init__(self, repo=None):
+    def __init__(self, repo=None, build_number='tag', write_commit_graph=False, version_sidecar=None, rev="HEAD"):
         """
         Constructs a new GitVersion object.
 
@@ -72,9 +127,41 @@ class GitVersion:
         ----------
         repo : str, optional
             The path to the Git repository. If not provided, uses the current directory.
+
+        build_number : str, optional
+            'tag' takes the build component from the tag (1.2.3-4), 'commits' counts the commits since the
+            nearest version tag and 'first-parent' counts the commits on the first-parent chain of HEAD.
+
+        write_commit_graph : bool, optional
+            Whether a missing commit-graph is written before commits are counted.
+
+        version_sidecar : str, optional
+            JSON file with precomputed versions per commit and build number mode. A full clone always resolves
+            the version and adds it to the file, a shallow clone of the same commit reads it from there.
+
+        rev : str, optional
+            The commit to read the version information for, e.g. a branch or tag. Nothing is checked out.
         """
-        self.repo = git.Repo(repo)
+        # GitPython takes a few hundred milliseconds to import, it is only loaded once a repository is opened
+        with span("git open", "git", path=repo):
+            import git
+
+            self.repo = git.Repo(repo)
         self.git = self.repo.git
+        self.rev = rev
+        self.version_sidecar = version_sidecar
+        self.build_number_mode = build_number
+        self.shallow = os.path.isfile(os.path.join(self.repo.common_dir, 'shallow'))
+        self.build_number = None
+        if build_number != 'tag':
+            self.build_number = BuildNumber(self.git, self.repo.working_tree_dir, build_number,
+                                            cache=rev == "HEAD", commit_graph=write_commit_graph)
+        self.refresh()
+
+    def refresh(self):
+        """
+        Reads all version information again using the open repository, e.g. after HEAD or a tag changed.
+        """
         self.get_datetime()
         self.get_branch()
         self.get_sha()
@@ -89,7 +176,8 @@ class GitVersion:
         datetime
             The date and time of the current commit.
         """
-        out = self.git.show("-s", "--format=%ci", "HEAD")
+        with span("git show", "git"):
+            out = self.git.show("-s", "--format=%ci", f"{self.rev}^{{commit}}")
         self.commit_date = datetime.datetime.strptime(out, "%Y-%m-%d %H:%M:%S %z")
         logging.debug(f"self.datetime: {self.commit_date}")
         return self.commit_date
@@ -103,7 +191,9 @@ class GitVersion:
         str
             The current branch name.
         """
-        self.branch = self.git.rev_parse("--abbrev-ref", "HEAD")
+        with span("git rev-parse --abbrev-ref", "git"):
+            # A SHA has no name, the branch is the rev itself then
+            self.branch = self.git.rev_parse("--abbrev-ref", self.rev) or self.rev
         return self.branch
 
     def get_sha(self):
@@ -115,34 +205,157 @@ class GitVersion:
         str
             The full SHA of the current commit.
         """
-        self.sha = self.git.rev_parse("HEAD")
+        with span("git rev-parse", "git"):
+            self.sha = self.git.rev_parse(f"{self.rev}^{{commit}}")
         self.short_sha = self.sha[:6]
         return self.sha
 
     def get_version(self):
         """
-        Retrieves the version number from the latest tag.
+        Retrieves the version number from the latest tag. If a build number mode is set, the build component
+        is the number of commits counted by it.
+
+        A version tag on the current commit is used without walking the history. Shallow clones are never
+        deepened, they read the version from the sidecar file if it has one for the commit and build number
+        mode, otherwise git describe only sees the commits that were fetched.
 
         Returns
         -------
         list
             The version number as a list of integers in the format [major, minor, patch, build].
         """
-        tag = self.git.describe("--tags", "--abbrev=0", "--always")
-        logging.debug(f"git describe --tags --abbrev=0 --always: {tag}")
-        match = re.match(r'(\d+)\.(\d+)\.(\d+)', tag)
-        if match:
-            self.version = [int(match.group(1)), int(match.group(2)), int(match.group(3)), 0]
+        # A full clone always resolves the version, tags added since the sidecar was written must count
+        if self.shallow:
+            entry = self.load_sidecar().get(self.sha)
+            if isinstance(entry, dict) and self.build_number_mode in entry:
+                self.version = list(entry[self.build_number_mode])
+                logging.info(f"Version of {self.short_sha} read from {self.version_sidecar}")
+                logging.debug(f"self.version: {self.version}")
+                return self.version
+
+        build = None
+        if self.build_number is not None and not self.shallow:
+            tag, build = self.build_number.get(self.sha)
+            tag = tag or ""
         else:
-            match = re.match(r'(\d+)\.(\d+)\.(\d+)-(\d+)', tag)
-            if match:
-                self.version = [int(match.group(1)), int(match.group(2)), int(match.group(3)), int(match.group(4))]
-            else:
-                logging.error(f"get_version: Could not parse version from tag: {tag} - using default version of 0.0.1.0")
-                self.version = [0, 0, 1, 0]
+            if self.build_number is not None:
+                logging.warning("Commits can not be counted in a shallow clone, "
+                                "using the build number of the tag, pass --version-sidecar to use a precomputed one")
+            tag = self.get_exact_tag()
+            if tag is None:
+                tag = self.describe()
+
+        version = parse_version(tag)
+        if version is None:
+            logging.error(f"get_version: Could not parse version from tag: {tag} - using default version of 0.0.1.0")
+            version = [0, 0, 1, 0]
+        if build is not None:
+            version[3] = build
+        self.version = version
         logging.debug(f"self.version: {self.version}")
+
+        if not self.shallow:
+            self.save_sidecar()
         return self.version
 
+    def describe(self):
+        """
+        Returns the nearest tag reachable from the current commit.
+
+        Returns
+        -------
+        str
+            The tag. In a full clone the short SHA if there is no tag, in a shallow clone an empty string if
+            no tag is reachable in the fetched history.
+        """
+        if not self.shallow:
+            with span("git describe", "git"):
+                tag = self.git.describe("--tags", "--abbrev=0", "--always", self.rev)
+            logging.debug(f"git describe --tags --abbrev=0 --always: {tag}")
+            return tag
+
+        with span("git describe", "git", shallow=True):
+            status, tag, _ = self.git.describe("--tags", "--abbrev=0", self.rev, with_exceptions=False,
+                                               with_extended_output=True)
+        if status != 0:
+            logging.warning("No tag reachable in the shallow clone, fetch the tags or pass --version-sidecar")
+            return ""
+        logging.debug(f"git describe --tags --abbrev=0: {tag}")
+        return tag
+
+    def get_exact_tag(self):
+        """
+        Returns the highest version tag pointing at the current commit. Reads packed-refs and the loose tag
+        refs, git is only started to peel loose tags.
+
+        Returns
+        -------
+        str or None
+            The tag, or None if no version tag points at the current commit.
+        """
+        with span("read tags", "git"):
+            tags = get_tags(self.repo.common_dir)
+        names = [name for name, (sha, peeled) in tags.items() if self.sha in (sha, peeled)]
+        if any(peeled is None and sha != self.sha for sha, peeled in tags.values()):
+            # Loose tags may be annotated, the commit they point at is only stored in the tag object
+            with span("git for-each-ref --points-at", "git"):
+                names = self.git.for_each_ref(f"--points-at={self.sha}", "--format=%(refname:strip=2)",
+                                              "refs/tags").splitlines()
+        versions = [name for name in names if parse_version(name) is not None]
+        if not versions:
+            return None
+        tag = max(versions, key=parse_version)
+        logging.debug(f"Tag {tag} points at {self.short_sha}")
+        return tag
+
+    def load_sidecar(self):
+        """
+        Loads the precomputed versions from the sidecar file.
+
+        Returns
+        -------
+        dict
+            The versions per build number mode by commit SHA, empty if there is no sidecar file.
+        """
+        if self.version_sidecar is None or not os.path.isfile(self.version_sidecar):
+            return {}
+        try:
+            with open(self.version_sidecar, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read version sidecar {self.version_sidecar}: {e}")
+            return {}
+
+    def save_sidecar(self):
+        """
+        Adds the current version to the sidecar file, the oldest entries are removed once it is full. The file
+        is read again under a lock right before it is replaced, parallel jobs sharing the sidecar keep each
+        other's entries.
+        """
+        if self.version_sidecar is None:
+            return
+        try:
+            with open(self.version_sidecar + '.lock', 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                sidecar = self.load_sidecar()
+                entry = sidecar.pop(self.sha, None)
+                if not isinstance(entry, dict):
+                    entry = {}
+                if entry.get(self.build_number_mode) == self.version:
+                    return
+                entry[self.build_number_mode] = self.version
+                # Most recently resolved commits last, they are the last to be removed
+                sidecar[self.sha] = entry
+                while len(sidecar) > MAX_SIDECAR_ENTRIES:
+                    del sidecar[next(iter(sidecar))]
+                # Written to a temporary file first, parallel runs must never see a partial file
+                with open(self.version_sidecar + f'.{os.getpid()}.tmp', 'w') as f:
+                    json.dump(sidecar, f, indent=4)
+                os.replace(self.version_sidecar + f'.{os.getpid()}.tmp', self.version_sidecar)
+        except OSError as e:
+            logging.warning(f"Could not write version sidecar {self.version_sidecar}: {e}")
+
 
 if __name__ == "__main__":
     git_version = GitVersion('../../')
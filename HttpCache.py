@@ -0,0 +1,332 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Caches HTTP responses in memory and on disk, keyed by request, with ETag/Last-Modified validators.
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class HttpCache:
+    """
+    A class used to cache HTTP responses in memory and, optionally, on disk.
+
+    ...
+
+    Attributes
+    ----------
+    directory : str
+        the directory the cache is persisted to, or None for a memory-only cache
+
+    max_entries : int
+        the maximum number of responses kept in memory
+
+    max_bytes : int
+        the maximum total size of the response bodies kept in memory
+
+    max_disk_entries : int
+        the maximum number of responses kept on disk
+
+    files : OrderedDict
+        the cache files on disk, least recently written first
+
+    Methods
+    -------
+    get(key):
+        Returns the cached entry for a key, or None.
+
+    is_fresh(entry, ttl):
+        Returns True if the entry is younger than ttl seconds.
+
+    get_conditional_headers(entry):
+        Returns the If-None-Match/If-Modified-Since headers used to revalidate an entry.
+
+    store(key, headers, body, ttl=0):
+        Stores a response in the cache.
+
+    touch(key, entry):
+        Marks an entry as revalidated by the server.
+
+    clear():
+        Removes all entries from memory and disk.
+    """
+    def __init__(self, directory=None, max_entries=256, max_disk_entries=1024, max_bytes=64 * 1024 * 1024):
+        """
+        Constructs a new HttpCache object.
+
+        Parameters
+        ----------
+        directory : str, optional
+            The directory the cache is persisted to. If not provided, the cache is memory-only.
+
+        max_entries : int, optional
+            The maximum number of responses kept in memory.
+
+        max_disk_entries : int, optional
+            The maximum number of responses kept on disk.
+
+        max_bytes : int, optional
+            The maximum total size of the response bodies kept in memory, larger responses are only kept on disk.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.size = 0
+        self.files = OrderedDict()
+        # The cache is shared by the threads of TeamCityCrawler
+        self.lock = threading.RLock()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.load_index()
+
+    def load_index(self):
+        """
+        Lists the cache files on disk once, oldest first. Writes keep the index up to date, so the directory is
+        not listed again when the cache is full.
+        """
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.json')]
+        mtimes = {}
+        for path in files:
+            try:
+                mtimes[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+        self.files = OrderedDict((path, None) for path in sorted(mtimes, key=mtimes.get))
+        self.prune()
+
+    def get_path(self, key):
+        """
+        Returns the path of the file an entry is persisted to.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        str
+            The path of the cache file.
+        """
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        """
+        Returns the cached entry for a key, looking in memory first and on disk second.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        Returns
+        -------
+        dict or None
+            The cached entry, or None if the key is not cached.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if self.directory is None:
+            return None
+
+        path = self.get_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('key') != key:
+            return None
+        self.remember(key, entry)
+        return entry
+
+    def remember(self, key, entry):
+        """
+        Puts an entry into the memory cache, evicting the least recently used entries until at most max_entries
+        remain and their bodies take at most max_bytes.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        entry : dict
+            The entry to remember.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)['body'])
+            if len(entry['body']) > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += len(entry['body'])
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.size -= len(self.entries.popitem(last=False)[1]['body'])
+
+    def is_fresh(self, entry, ttl):
+        """
+        Returns True if the entry is younger than ttl seconds and can be used without asking the server.
+
+        Parameters
+        ----------
+        entry : dict
+            The cached entry.
+
+        ttl : float
+            The time to live in seconds.
+
+        Returns
+        -------
+        bool
+            True if the entry is fresh, False otherwise.
+        """
+        return ttl > 0 and time.time() - entry['stored'] < ttl
+
+    def get_conditional_headers(self, entry):
+        """
+        Returns the headers used to revalidate an entry with a conditional request.
+
+        Parameters
+        ----------
+        entry : dict
+            The cached entry.
+
+        Returns
+        -------
+        dict
+            The If-None-Match and If-Modified-Since headers.
+        """
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key, headers, body, ttl=0):
+        """
+        Stores a response in the cache. Responses without ETag or Last-Modified are only stored if ttl is set.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        headers : dict
+            The response headers.
+
+        body : str
+            The response body.
+
+        ttl : float, optional
+            The time to live the entry will be used with.
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag is None and last_modified is None and ttl <= 0:
+            return
+
+        entry = {
+            'key': key,
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored': time.time(),
+            'body': body
+        }
+        self.remember(key, entry)
+        self.persist(key, entry)
+
+    def touch(self, key, entry):
+        """
+        Marks an entry as revalidated by the server, restarting its time to live.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        entry : dict
+            The cached entry.
+        """
+        entry['stored'] = time.time()
+        self.remember(key, entry)
+        self.persist(key, entry)
+
+    def persist(self, key, entry):
+        """
+        Writes an entry to disk and removes the oldest files if the disk cache is full.
+
+        Parameters
+        ----------
+        key : str
+            The cache key.
+
+        entry : dict
+            The entry to write.
+        """
+        if self.directory is None:
+            return
+
+        path = self.get_path(key)
+        # Every thread writes its own temporary file, only the index is updated under the lock
+        tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning("Could not write cache file %s: %s" % (path, e))
+            return
+        with self.lock:
+            self.files[path] = None
+            self.files.move_to_end(path)
+            self.prune()
+
+    def prune(self):
+        """
+        Removes the least recently written files from disk until at most max_disk_entries remain.
+        """
+        with self.lock:
+            while len(self.files) > self.max_disk_entries:
+                path = self.files.popitem(last=False)[0]
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Another process sharing the directory may have removed it already
+                    pass
+
+    def clear(self):
+        """
+        Removes all entries from memory and disk.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.files.clear()
+            if self.directory is None:
+                return
+            for f in os.listdir(self.directory):
+                if f.endswith('.json'):
+                    os.remove(os.path.join(self.directory, f))
@@ -0,0 +1,96 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Checks the import time of the entry points against a budget using python -X importtime.
+# Exits with 1 if an entry point is over budget or imports a heavy dependency at load time.
+import argparse
+import logging
+import os
+import re
+import subprocess
+import sys
+
+# Entry point, budget in milliseconds and the modules it must not import at load time
+ENTRY_POINTS = {
+    "main": (50, ["git", "gitdb", "smmap", "requests"]),
+    "TeamCity": (50, ["requests", "urllib3"]),
+}
+
+
+def measure_import_time(module, runs=5):
+    """
+    Measures the cumulative import time of a module in a fresh interpreter.
+
+    Parameters
+    ----------
+    module : str
+        The module to import.
+
+    runs : int, optional
+        The number of interpreters started, the fastest run is reported.
+
+    Returns
+    -------
+    tuple
+        The import time in milliseconds and the set of all imported modules.
+    """
+    best = None
+    modules = set()
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Could not import {module}: {result.stderr}")
+
+        cumulative = None
+        modules = set()
+        for line in result.stderr.splitlines():
+            match = re.match(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$', line)
+            if not match:
+                continue
+            modules.add(match.group(4).split('.')[0])
+            if match.group(3) == ' ' and match.group(4) == module:
+                cumulative = int(match.group(2)) / 1000
+        if cumulative is not None and (best is None or cumulative < best):
+            best = cumulative
+    return best, modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Checks the import time of the entry points')
+    parser.add_argument('--runs', type=int, help='Interpreters started per entry point', default=5)
+    parser.add_argument('--scale', type=float, help='Factor applied to all budgets, for slow machines', default=1.0)
+    parser.add_argument('--log', type=str, help='Log level', default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    failed = False
+    for entry_point, (budget, forbidden) in ENTRY_POINTS.items():
+        import_time, imported = measure_import_time(entry_point, args.runs)
+        budget = budget * args.scale
+        heavy = sorted(set(forbidden) & imported)
+        if heavy:
+            logging.error(f"{entry_point} imports {', '.join(heavy)} at load time")
+            failed = True
+        if import_time > budget:
+            logging.error(f"{entry_point} takes {import_time:.1f} ms to import, budget is {budget:.1f} ms")
+            failed = True
+        else:
+            logging.info(f"{entry_point} takes {import_time:.1f} ms to import, budget is {budget:.1f} ms")
+
+    sys.exit(1 if failed else 0)
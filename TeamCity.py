@@ -16,50 +16,99 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import argparse
+import atexit
 import json
 import logging
 import os
 import sys
 
-import requests
+from HttpCache import HttpCache
+from TeamCityBase import TeamCityBase
+from Trace import span, tracer
 
 
-class TeamCity:
-    host = None
-    token = None
+class TeamCity(TeamCityBase):
+    http_session = None
 
-    def __init__(self, host, token):
-        self.token = token
-        self.host = host
-        if self.host.endswith('/'):
-            self.host = self.host[:-1]
+    def get_http_session(self):
+        # Reuse connections between requests, the pool is sized for the threads of TeamCityCrawler
+        if self.http_session is None:
+            # requests is only imported once the first request is sent, --help and argument errors stay fast
+            import requests
 
-    def get_headers(self):
-        return {
-            "Accept": "Application/JSON",
-            "Authorization": "Bearer %s" % self.token
-        }
+            self.http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            self.http_session.mount('http://', adapter)
+            self.http_session.mount('https://', adapter)
+        return self.http_session
 
     def query_tc_api(self, url):
         logging.debug("Querying TeamCity API: %s" % url)
 
-        r = requests.get(self.host + url, headers=self.get_headers(), timeout=5)
-        logging.debug("Received: %s" % r.text)
-        if r.status_code != 200:
-            return None, r.status_code
-        return json.loads(r.text), 200
+        with span("http GET", "http", url=url) as trace:
+            headers = self.get_headers()
+            entry = None
+            if self.cache is not None:
+                key = self.get_cache_key(url)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    if self.cache.is_fresh(entry, self.get_ttl(url)):
+                        logging.debug("Cache hit: %s" % url)
+                        trace['cache'] = 'hit'
+                        return json.loads(entry['body']), 200
+                    headers.update(self.cache.get_conditional_headers(entry))
+
+            r = self.get_http_session().get(self.host + url, headers=headers, timeout=5)
+            trace['status'] = r.status_code
+            trace['bytes'] = len(r.content)
+            if r.status_code == 304 and entry is not None:
+                logging.debug("Not modified: %s" % url)
+                trace['cache'] = 'revalidated'
+                self.cache.touch(key, entry)
+                return json.loads(entry['body']), 200
+
+            logging.debug("Received: %s" % r.text)
+            if r.status_code != 200:
+                return None, r.status_code
+            if self.cache is not None:
+                self.cache.store(key, r.headers, r.text, self.get_ttl(url))
+            return json.loads(r.text), 200
 
     def get_build_id(self, build_type, status='SUCCESS'):
-        api_result, api_code = self.query_tc_api(
-            "/app/rest/builds/?locator=buildType:%s,status:%s" % (build_type, status))
-        builds = api_result['build']
-        build = sorted(builds, key=lambda k: k['number'], reverse=True)[0]
+        build = self.get_latest_build(build_type, status)
+        if build is None:
+            logging.warning("No builds found for build type %s" % build_type)
+            return None
         return build['id']
 
+    def get_latest_build(self, build_type, status='SUCCESS', fields='id,number'):
+        # TeamCity returns builds newest first, so the server only has to send one
+        api_result, api_code = self.query_tc_api(
+            "/app/rest/builds/?locator=buildType:%s,status:%s,count:1&fields=build(%s)" % (build_type, status, fields))
+        if api_result is None or not api_result.get('build'):
+            return None
+        return api_result['build'][0]
+
+    def iter_builds(self, locator, fields='id,number', page_size=100):
+        url = "/app/rest/builds/?locator=%s,count:%d&fields=nextHref,build(%s)" % (locator, page_size, fields)
+        while url is not None:
+            api_result, api_code = self.query_tc_api(url)
+            if api_result is None:
+                logging.warning("Could not list builds for locator %s: %d" % (locator, api_code))
+                return
+            for build in api_result.get('build', []):
+                yield build
+
+            url = api_result.get('nextHref')
+            if url is not None:
+                url = self.get_relative_url(url)
+
     def list_artifacts(self, project, bt):
         build_id = self.get_build_id(bt)
+        if build_id is None:
+            return None
         api_result, api_code = self.query_tc_api("/app/rest/builds/id:%s/artifacts" % build_id)
-        if 'file' not in api_result:
+        if api_result is None or 'file' not in api_result:
             logging.warning("No artifacts found for build type %s" % bt)
             return None
 
@@ -71,7 +120,7 @@ class TeamCity:
 
     def list_projects(self):
         api_result, api_code = self.query_tc_api("/app/rest/projects")
-        if 'project' not in api_result:
+        if api_result is None or 'project' not in api_result:
             logging.warning("No projects found")
             return None
 
@@ -84,7 +133,7 @@ class TeamCity:
 
     def list_subprojects(self, project):
         api_result, api_code = self.query_tc_api("/app/rest/projects/id:%s" % project)
-        if 'projects' not in api_result:
+        if api_result is None or 'projects' not in api_result:
             logging.warning("No projects found for project %s" % project)
             return None
         projects = api_result['projects']
@@ -100,7 +149,7 @@ class TeamCity:
 
     def list_build_types(self, project):
         api_result, api_code = self.query_tc_api("/app/rest/projects/id:%s" % "_".join([project]))
-        if 'buildTypes' not in api_result:
+        if api_result is None or 'buildTypes' not in api_result:
             logging.warning("No build types found for project %s" % project)
             return None
         build_types = api_result['buildTypes']
@@ -116,21 +165,21 @@ class TeamCity:
 
     def list_tags(self, project, bt):
         api_result, api_code = self.query_tc_api("/app/rest/builds/?locator=buildType:%s,lookupLimit:10" % bt)
-        if 'build' not in api_result:
+        if api_result is None or 'build' not in api_result:
             logging.warning("No builds found for build type %s" % bt)
             return None
 
         builds = api_result['build']
-        build_hrefs = [b['href'] for b in builds]
+        build_hrefs = [self.get_relative_url(b['href']) for b in builds]
         ret = []
         for h in build_hrefs:
-            api = self.query_tc_api(h)
-            if 'tags' not in api:
+            api, code = self.query_tc_api(h)
+            if api is None or 'tags' not in api:
                 continue
             tags = api['tags']
-            for t in tags['tag']:
-                if len(t) == 40:
-                    ret.append(t)
+            for t in tags.get('tag', []):
+                if len(t['name']) == 40:
+                    ret.append(t['name'])
         return json.dumps({
             'project': project,
             'build_type': bt,
@@ -140,14 +189,38 @@ class TeamCity:
     def get_artifact(self, project, bt, artifact):
         build_id = self.get_build_id(bt)
 
-        r = requests.get("/app/rest/builds/id:%s/artifacts/content/%s" % (build_id, artifact),
-                         headers=self.get_headers())
+        with span("http GET artifact", "http", artifact=artifact, build_id=build_id) as trace:
+            r = self.get_http_session().get(
+                self.host + "/app/rest/builds/id:%s/artifacts/content/%s" % (build_id, artifact),
+                headers=self.get_headers())
+            trace['status'] = r.status_code
+            trace['bytes'] = len(r.content)
         # Check if the request was successful
         if r.status_code != 200:
             raise Exception("%s: %s" % (r.reason, r.text))
 
         return r.content
 
+    def download_artifact(self, project, bt, artifact, path, chunk_size=1024 * 1024):
+        build_id = self.get_build_id(bt)
+
+        # Stream to disk, artifacts can be several gigabytes
+        with span("http GET artifact", "http", artifact=artifact, build_id=build_id, path=path) as trace, \
+                self.get_http_session().get(
+                    self.host + "/app/rest/builds/id:%s/artifacts/content/%s" % (build_id, artifact),
+                    headers=self.get_headers(), stream=True, timeout=5) as r:
+            trace['status'] = r.status_code
+            if r.status_code != 200:
+                raise Exception("%s: %s" % (r.reason, r.text))
+
+            size = 0
+            with open(path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size):
+                    f.write(chunk)
+                    size += len(chunk)
+            trace['bytes'] = size
+        return size
+
     def check_connection(self):
         try:
             api_result, status_code = self.query_tc_api("/app/rest/server")
@@ -165,14 +238,30 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--buildtype', help='Build type')
     parser.add_argument('-t', '--tag', help='Tag (usually the commit sha)')
     parser.add_argument('-a', '--artifact', help='Artifact to retrieve')
+    parser.add_argument('-o', '--output', help='File to write the artifact to, defaults to the artifact name')
     parser.add_argument('--token', help='TeamCity token')
     parser.add_argument('--host', help='TeamCity host')
     parser.add_argument('--log', help='Log level', default='INFO')
+    parser.add_argument('--cache-dir', help='Directory to persist the response cache in',
+                        default=os.getenv("TEAMCITY_CACHE_DIR"))
+    parser.add_argument('--cache-ttl', type=float, help='Seconds project and build type lists are cached for',
+                        default=300)
+    parser.add_argument('--no-cache', action='store_true', help='Do not cache responses')
+    parser.add_argument('--timings', action='store_true', help='Log the time spent per request type')
+    parser.add_argument('--trace-json', help='Write a trace of all requests, as JSON lines if the file ends in .jsonl')
+    parser.add_argument('--trace-format', choices=['chrome', 'jsonl'], help='Format of --trace-json')
 
     args = parser.parse_args()
 
     logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
 
+    if args.timings or args.trace_json:
+        tracer.enable()
+        if args.timings:
+            atexit.register(tracer.log_summary)
+        if args.trace_json:
+            atexit.register(tracer.write, args.trace_json, args.trace_format)
+
     if args.token is not None:
         token = args.token
     elif os.getenv("TEAMCITY_TOKEN") is not None:
@@ -193,7 +282,10 @@ if __name__ == '__main__':
         logging.error("Must set TEAMCITY_TOKEN, TEAMCITY_HOST env vars.")
         sys.exit(1)
 
-    teamcity = TeamCity(host, token)
+    cache = None
+    if not args.no_cache:
+        cache = HttpCache(args.cache_dir)
+    teamcity = TeamCity(host, token, cache, args.cache_ttl)
     connection, code = teamcity.check_connection()
     if connection is False:
         logging.error("Could not connect to TeamCity")
@@ -239,4 +331,6 @@ if __name__ == '__main__':
             logging.error("No artifacts found for build type %s" % build_type)
         sys.exit(1)
 
-    teamcity.get_artifact(project, build_type, artifact)
+    output = args.output if args.output is not None else os.path.basename(artifact)
+    logging.info("Downloading %s to %s" % (artifact, output))
+    teamcity.download_artifact(project, build_type, artifact, output)
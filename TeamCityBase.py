@@ -0,0 +1,62 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Request independent parts of the TeamCity clients, shared by TeamCity.py and AsyncTeamCity.py
+import hashlib
+from urllib.parse import urlparse
+
+# Endpoints whose responses rarely change and may be served from the cache without revalidation
+METADATA_PREFIXES = ('/app/rest/projects', '/app/rest/buildTypes')
+
+
+class TeamCityBase:
+    host = None
+    token = None
+    cache = None
+    metadata_ttl = 0
+
+    def __init__(self, host, token, cache=None, metadata_ttl=300):
+        self.token = token
+        self.host = host
+        if self.host.endswith('/'):
+            self.host = self.host[:-1]
+        self.cache = cache
+        self.metadata_ttl = metadata_ttl
+
+    def get_headers(self):
+        return {
+            "Accept": "Application/JSON",
+            "Authorization": "Bearer %s" % self.token
+        }
+
+    def get_cache_key(self, url):
+        # The token is part of the key, different users may see different projects
+        return "%s %s %s" % (hashlib.sha1(self.token.encode('utf-8')).hexdigest(), self.host, url)
+
+    def get_ttl(self, url):
+        if url.startswith(METADATA_PREFIXES):
+            return self.metadata_ttl
+        if url.startswith('/app/rest/builds/id:') and url.endswith('/artifacts'):
+            return self.metadata_ttl
+        return 0
+
+    def get_relative_url(self, href):
+        # Hrefs returned by TeamCity are relative to the server root and contain the context path of self.host
+        context_path = urlparse(self.host).path
+        if context_path and href.startswith(context_path + '/'):
+            return href[len(context_path):]
+        return href
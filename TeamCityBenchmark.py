@@ -0,0 +1,192 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Measures the TeamCity clients against TeamCityStub
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from HttpCache import HttpCache
+from TeamCity import TeamCity
+from TeamCityCrawler import TeamCityCrawler
+from TeamCityStub import TeamCityStub
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round(p * (len(values) - 1)))]
+
+
+class TeamCityBenchmark:
+    """
+    Measures throughput, latency, download speed and peak memory of the TeamCity client
+    operations against a TeamCityStub.
+    """
+    def __init__(self, stub, iterations=50, concurrency=1, cache=False):
+        self.stub = stub
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.cache = cache
+        self.directory = None
+
+    def create_client(self):
+        return TeamCity(self.stub.url, 'benchmark', HttpCache() if self.cache else None)
+
+    def get_operations(self):
+        build_type = 'Project0_Build0'
+        artifact = 'artifact0.zip'
+        size = self.stub.artifact_size
+        return [
+            ('check_connection', self.check_connection, 0),
+            ('list_projects', lambda tc: tc.list_projects(), 0),
+            ('list_subprojects', lambda tc: tc.list_subprojects('Project0'), 0),
+            ('list_build_types', lambda tc: tc.list_build_types('Project0'), 0),
+            ('get_build_id', lambda tc: tc.get_build_id(build_type), 0),
+            ('iter_builds', lambda tc: self.count_builds(tc, build_type), 0),
+            ('list_artifacts', lambda tc: tc.list_artifacts('Project0', build_type), 0),
+            ('get_artifact', lambda tc: tc.get_artifact('Project0', build_type, artifact), size),
+            ('download_artifact', lambda tc: tc.download_artifact(
+                'Project0', build_type, artifact, os.path.join(self.directory, 'artifact%d' % threading.get_ident())),
+             size),
+            ('crawl', lambda tc: TeamCityCrawler(tc, 8).crawl(), 0),
+        ]
+
+    def check_connection(self, teamcity):
+        # check_connection reports failures in its result instead of raising
+        connection, code = teamcity.check_connection()
+        if not connection:
+            raise Exception("Status code %d" % code)
+        return code
+
+    def count_builds(self, teamcity, build_type):
+        # iter_builds stops early when a page fails, a short listing is a failure
+        count = sum(1 for _ in teamcity.iter_builds('buildType:%s' % build_type))
+        if count != self.stub.builds:
+            raise Exception("Listed %d of %d builds" % (count, self.stub.builds))
+        return count
+
+    def measure(self, name, operation, size):
+        teamcity = self.create_client()
+        def timed(_):
+            start = time.perf_counter()
+            try:
+                # The client reports most failures by returning None
+                if operation(teamcity) is None:
+                    return time.perf_counter() - start, Exception("Operation returned None")
+                return time.perf_counter() - start, None
+            except Exception as e:
+                return time.perf_counter() - start, e
+
+        # Warm up the connection pool so connection setup is not part of the first sample
+        timed(0)
+
+        requests_before = self.stub.requests
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            samples = list(executor.map(timed, range(self.iterations)))
+        elapsed = time.perf_counter() - start
+        http_requests = self.stub.requests - requests_before
+
+        latencies = [s[0] for s in samples if s[1] is None]
+        errors = [s[1] for s in samples if s[1] is not None]
+        for e in errors[:1]:
+            logging.warning("%s failed: %s" % (name, e))
+
+        # Tracing allocations slows everything down, so memory is measured in a separate run
+        tracemalloc.start()
+        try:
+            operation(teamcity)
+        except Exception:
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'operation': name,
+            'iterations': self.iterations,
+            'concurrency': self.concurrency,
+            'errors': len(errors),
+            'seconds': elapsed,
+            'operations_per_second': len(samples) / elapsed if elapsed > 0 else 0.0,
+            'http_requests_per_second': http_requests / elapsed if elapsed > 0 else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'mb_per_second': size * len(latencies) / elapsed / (1024 * 1024) if size and elapsed > 0 else None,
+            'peak_memory_kb': peak / 1024
+        }
+
+    def run(self, operations=None):
+        results = []
+        self.directory = tempfile.mkdtemp(prefix='teamcity-benchmark-')
+        try:
+            for name, operation, size in self.get_operations():
+                if operations and name not in operations:
+                    continue
+                logging.info("Benchmarking %s" % name)
+                results.append(self.measure(name, operation, size))
+        finally:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        return results
+
+
+def print_results(results):
+    print("%-18s %10s %10s %10s %10s %10s %12s %6s" % (
+        'operation', 'ops/s', 'req/s', 'p50 ms', 'p99 ms', 'MB/s', 'peak KiB', 'errors'))
+    for r in results:
+        print("%-18s %10.1f %10.1f %10.2f %10.2f %10s %12.1f %6d" % (
+            r['operation'], r['operations_per_second'], r['http_requests_per_second'], r['p50_ms'], r['p99_ms'],
+            '%.1f' % r['mb_per_second'] if r['mb_per_second'] is not None else '-', r['peak_memory_kb'],
+            r['errors']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the TeamCity client against a local TeamCity stub')
+    parser.add_argument('-n', '--iterations', type=int, help='Iterations per operation', default=50)
+    parser.add_argument('-c', '--concurrency', type=int, help='Concurrent calls per operation', default=1)
+    parser.add_argument('--operation', action='append', help='Only run this operation, can be repeated')
+    parser.add_argument('--cache', action='store_true', help='Use an in-memory response cache')
+    parser.add_argument('--latency', type=float, help='Seconds every stub request is delayed', default=0.0)
+    parser.add_argument('--builds', type=int, help='Number of builds per build type', default=250)
+    parser.add_argument('--artifact-size', type=int, help='Size of every artifact in bytes', default=16 * 1024 * 1024)
+    parser.add_argument('--failure-rate', type=float, help='Fraction of requests answered with 500', default=0.0)
+    parser.add_argument('--output', help='File to write the results to as JSON')
+    parser.add_argument('--log', help='Log level', default='INFO')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    with TeamCityStub(latency=args.latency, builds=args.builds, artifact_size=args.artifact_size,
+                      failure_rate=args.failure_rate) as teamcity_stub:
+        benchmark = TeamCityBenchmark(teamcity_stub, args.iterations, args.concurrency, args.cache)
+        benchmark_results = benchmark.run(args.operation)
+
+    print_results(benchmark_results)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(benchmark_results, f, sort_keys=True, indent=4, separators=(',', ': '))
+    if any(r['errors'] for r in benchmark_results) and args.failure_rate == 0:
+        sys.exit(1)
@@ -0,0 +1,147 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Snapshots the project tree, build types and latest builds of a TeamCity server with a thread pool
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from HttpCache import HttpCache
+from TeamCity import TeamCity
+
+PROJECT_FIELDS = "id,name,parentProjectId,projects(project(id)),buildTypes(buildType(id,name))"
+BUILD_FIELDS = "id,number,status,finishDate"
+
+
+class TeamCityCrawler:
+    """
+    Walks a TeamCity project hierarchy with a bounded thread pool. Every level of the tree is
+    requested at once, identical requests are only sent once per crawl.
+    """
+    teamcity = None
+    max_workers = 0
+
+    def __init__(self, teamcity, max_workers=16, latest_builds=True):
+        self.teamcity = teamcity
+        self.max_workers = max_workers
+        self.latest_builds = latest_builds
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, key, fn, *args):
+        with self.lock:
+            if key not in self.requests:
+                self.requests[key] = self.executor.submit(fn, *args)
+            return self.requests[key]
+
+    def fetch(self, url):
+        return self.submit(url, self.teamcity.query_tc_api, url)
+
+    def fetch_latest_build(self, build_type):
+        return self.submit(('latestBuild', build_type), self.teamcity.get_latest_build, build_type, 'SUCCESS',
+                           BUILD_FIELDS)
+
+    def crawl(self, root='_Root'):
+        self.requests = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as self.executor:
+            nodes = {}
+            builds = {}
+            level = [root]
+            while level:
+                futures = [(p, self.fetch("/app/rest/projects/id:%s?fields=%s" % (p, PROJECT_FIELDS)))
+                           for p in level if p not in nodes]
+                level = []
+                for project, future in futures:
+                    # A failed request only leaves out its own part of the tree
+                    try:
+                        api_result, api_code = future.result()
+                    except Exception as e:
+                        logging.warning("Could not read project %s: %s" % (project, e))
+                        nodes[project] = {'id': project, 'error': str(e), 'buildTypes': [], 'projects': []}
+                        continue
+                    if api_result is None:
+                        logging.warning("Could not read project %s: %d" % (project, api_code))
+                        nodes[project] = {'id': project, 'error': api_code, 'buildTypes': [], 'projects': []}
+                        continue
+
+                    build_types = api_result.get('buildTypes', {}).get('buildType', [])
+                    children = [p['id'] for p in api_result.get('projects', {}).get('project', [])]
+                    nodes[project] = {
+                        'id': api_result['id'],
+                        'name': api_result.get('name'),
+                        'buildTypes': [{'id': b['id'], 'name': b.get('name')} for b in build_types],
+                        'projects': children
+                    }
+                    if self.latest_builds:
+                        for b in build_types:
+                            builds[b['id']] = self.fetch_latest_build(b['id'])
+                    level.extend(children)
+
+            for node in nodes.values():
+                for build_type in node['buildTypes']:
+                    if build_type['id'] not in builds:
+                        continue
+                    try:
+                        build_type['latestBuild'] = builds[build_type['id']].result()
+                    except Exception as e:
+                        logging.warning("Could not read the latest build of %s: %s" % (build_type['id'], e))
+                        build_type['latestBuild'] = None
+                        build_type['error'] = str(e)
+        self.executor = None
+
+        logging.info("Crawled %d projects with %d requests" % (len(nodes), len(self.requests)))
+        return self.build_tree(nodes, root)
+
+    def build_tree(self, nodes, project):
+        node = dict(nodes[project])
+        node['projects'] = [self.build_tree(nodes, p) for p in node['projects'] if p in nodes]
+        return node
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--project', help='Project to start crawling at', default='_Root')
+    parser.add_argument('-o', '--output', help='File to write the JSON snapshot to, stdout if not set')
+    parser.add_argument('-w', '--workers', type=int, help='Number of concurrent requests', default=16)
+    parser.add_argument('--no-builds', action='store_true', help='Do not look up the latest build of build types')
+    parser.add_argument('--token', help='TeamCity token', default=os.getenv("TEAMCITY_TOKEN"))
+    parser.add_argument('--host', help='TeamCity host', default=os.getenv("TEAMCITY_HOST"))
+    parser.add_argument('--cache-dir', help='Directory to persist the response cache in',
+                        default=os.getenv("TEAMCITY_CACHE_DIR"))
+    parser.add_argument('--log', help='Log level', default='INFO')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    if not (args.token and args.host):
+        logging.error("Must supply --token and --host or set TEAMCITY_TOKEN, TEAMCITY_HOST env vars.")
+        sys.exit(1)
+
+    crawler = TeamCityCrawler(TeamCity(args.host, args.token, HttpCache(args.cache_dir)), args.workers,
+                              not args.no_builds)
+    snapshot = json.dumps(crawler.crawl(args.project), sort_keys=True, indent=4, separators=(',', ': '))
+    if args.output is None:
+        print(snapshot)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(snapshot)
@@ -0,0 +1,248 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Local stand-in for the TeamCity REST API, used to test and benchmark the clients offline
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class TeamCityStub:
+    """
+    Local stand-in for the parts of the TeamCity REST API used by TeamCity.py.
+
+    The server generates projects, build types, builds and artifacts on the fly. Latency, payload
+    sizes and the rate of failed requests can be configured to test the client offline.
+
+    with TeamCityStub(latency=0.01) as stub:
+        teamcity = TeamCity(stub.url, "token")
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, projects=10, subprojects=2, build_types=3, builds=250,
+                 artifacts=5, artifact_size=1024 * 1024, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.projects = projects
+        self.subprojects = subprojects
+        self.build_types = build_types
+        self.builds = builds
+        self.artifacts = artifacts
+        self.artifact_size = artifact_size
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.create_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logging.info("TeamCity stub listening on %s" % self.url)
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def get_project_ids(self):
+        ret = []
+        for p in range(self.projects):
+            ret.append("Project%d" % p)
+            for s in range(self.subprojects):
+                ret.append("Project%d_Sub%d" % (p, s))
+        return ret
+
+    def get_build_type_ids(self, project):
+        return ["%s_Build%d" % (project, b) for b in range(self.build_types)]
+
+    def get_build_ids(self, build_type):
+        # Build ids are derived from the build type so they can be resolved without any state
+        base = int(hashlib.sha1(build_type.encode('utf-8')).hexdigest()[:6], 16) * 100000
+        return [base + n for n in range(self.builds, 0, -1)]
+
+    def get_build(self, build_id):
+        number = build_id % 100000
+        return {
+            'id': build_id,
+            'number': str(number),
+            'status': 'SUCCESS',
+            'href': "/app/rest/builds/id:%d" % build_id,
+            'finishDate': "20240101T%06d+0000" % (number % 240000),
+            'tags': {'tag': [{'name': hashlib.sha1(str(build_id).encode('utf-8')).hexdigest()}]}
+        }
+
+    def get_project(self, project):
+        children = []
+        if '_' not in project:
+            children = ["%s_Sub%d" % (project, s) for s in range(self.subprojects)]
+        if project == '_Root':
+            children = ["Project%d" % p for p in range(self.projects)]
+        return {
+            'id': project,
+            'name': project,
+            'parentProjectId': '_Root' if project != '_Root' else None,
+            'projects': {'count': len(children), 'project': [{'id': c, 'name': c} for c in children]},
+            'buildTypes': {'buildType': [{'id': b, 'name': b} for b in self.get_build_type_ids(project)]}
+        }
+
+    def list_builds(self, locator):
+        values = dict(v.split(':', 1) for v in locator.split(',') if ':' in v)
+        build_type = values.get('buildType')
+        builds = self.get_build_ids(build_type) if build_type else []
+        start = int(values.get('start', 0))
+        count = int(values.get('count', 100))
+        if 'lookupLimit' in values:
+            count = min(count, int(values['lookupLimit']))
+
+        ret = {'count': len(builds[start:start + count]),
+               'build': [self.get_build(b) for b in builds[start:start + count]]}
+        if start + count < len(builds):
+            values['start'] = str(start + count)
+            ret['nextHref'] = "/app/rest/builds?locator=%s" % ",".join("%s:%s" % i for i in values.items())
+        return ret
+
+    def get_artifacts(self, build_id):
+        return {'count': self.artifacts,
+                'file': [{'name': "artifact%d.zip" % a, 'size': self.artifact_size} for a in range(self.artifacts)]}
+
+    def route(self, path, query):
+        if path == '/app/rest/server':
+            return {'version': 'stub', 'buildNumber': '0'}
+        if path == '/app/rest/projects':
+            projects = ['_Root'] + self.get_project_ids()
+            return {'count': len(projects), 'project': [{'id': p, 'name': p} for p in projects]}
+        match = re.match(r'^/app/rest/projects/id:([^/]+)$', path)
+        if match:
+            return self.get_project(match.group(1))
+        if path in ('/app/rest/builds', '/app/rest/builds/'):
+            return self.list_builds(query.get('locator', [''])[0])
+        match = re.match(r'^/app/rest/builds/id:(\d+)$', path)
+        if match:
+            return self.get_build(int(match.group(1)))
+        match = re.match(r'^/app/rest/builds/id:(\d+)/artifacts$', path)
+        if match:
+            return self.get_artifacts(int(match.group(1)))
+        return None
+
+    def create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, delayed ACKs would add 40ms to every keep-alive request
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+                if stub.should_fail():
+                    return self.send_body(500, b'Injected failure', 'text/plain')
+
+                url = urlparse(self.path)
+                if re.match(r'^/app/rest/builds/id:\d+/artifacts/content/.+$', url.path):
+                    return self.send_artifact()
+
+                result = stub.route(url.path, parse_qs(url.query))
+                if result is None:
+                    return self.send_body(404, b'Not found', 'text/plain')
+
+                body = json.dumps(result).encode('utf-8')
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_body(200, body, 'application/json', {'ETag': etag})
+
+            def send_body(self, code, body, content_type, headers=None):
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_artifact(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(stub.artifact_size))
+                self.end_headers()
+                chunk = b'\0' * (64 * 1024)
+                remaining = stub.artifact_size
+                while remaining > 0:
+                    self.wfile.write(chunk[:remaining])
+                    remaining -= len(chunk)
+
+            def log_message(self, format, *args):
+                logging.debug("TeamCity stub: " + format % args)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the TeamCity REST API')
+    parser.add_argument('--host', help='Address to listen on', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='Port to listen on', default=8111)
+    parser.add_argument('--latency', type=float, help='Seconds every request is delayed', default=0.0)
+    parser.add_argument('--projects', type=int, help='Number of top level projects', default=10)
+    parser.add_argument('--subprojects', type=int, help='Number of subprojects per project', default=2)
+    parser.add_argument('--build-types', type=int, help='Number of build types per project', default=3)
+    parser.add_argument('--builds', type=int, help='Number of builds per build type', default=250)
+    parser.add_argument('--artifacts', type=int, help='Number of artifacts per build', default=5)
+    parser.add_argument('--artifact-size', type=int, help='Size of every artifact in bytes', default=1024 * 1024)
+    parser.add_argument('--failure-rate', type=float, help='Fraction of requests answered with 500', default=0.0)
+    parser.add_argument('--log', help='Log level', default='INFO')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    stub = TeamCityStub(args.host, args.port, args.latency, args.projects, args.subprojects, args.build_types,
+                        args.builds, args.artifacts, args.artifact_size, args.failure_rate)
+    logging.info("TeamCity stub listening on %s" % stub.url)
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
@@ -19,6 +19,8 @@
 import logging
 import re
 
+from Trace import span
+
 
 class Template:
     """
@@ -37,6 +39,9 @@ class Template:
     variables : dict
         the variables to be replaced in the template
 
+    source : GitBlobSource
+        the repository the template is read from, or None to read it from disk
+
     Methods
     -------
     load():
@@ -60,16 +65,20 @@ class Template:
     options = {}
     variables = {}
 
-    def __init__(self, filename):
+    def __init__(self, filename, source=None):
         """
         Constructs a new Template object.
 
         Parameters
         ----------
         filename : str
-            The path to the template file.
+            The path to the template file, or '<tree-ish>:<path>' if a source is provided.
+
+        source : GitBlobSource, optional
+            The repository to read the template from instead of the disk.
         """
         self.filename = filename
+        self.source = source
         self.template = ""
         self.variables = {}
         self.load()
@@ -79,8 +88,12 @@ class Template:
         Loads the template from the file.
         """
         logging.debug(f"Loading {self.filename}")
-        with open(self.filename, 'r') as file:
-            self.template = file.read()
+        with span("template load", "template", file=self.filename):
+            if self.source is not None:
+                self.template = self.source.read(self.filename)
+                return
+            with open(self.filename, 'r') as file:
+                self.template = file.read()
 
     def set_variables(self, variables):
         """
@@ -113,10 +126,11 @@ class Template:
         """
         Replaces all instances of {{variable}} in the template with the value of the variable.
         """
-        self.output = self.template
-        for key, value in self.variables.items():
-            logging.debug(f"Replacing {{{{{key}}}}} with {value}")
-            self.output = re.sub(r'{{\s*' + key + r'\s*}}', value, self.output)
+        with span("template replace", "template", file=self.filename, variables=len(self.variables)):
+            self.output = self.template
+            for key, value in self.variables.items():
+                logging.debug(f"Replacing {{{{{key}}}}} with {value}")
+                self.output = re.sub(r'{{\s*' + key + r'\s*}}', value, self.output)
 
     def write(self, filename):
         """
@@ -127,5 +141,5 @@ class Template:
         filename : str
             The path to the new file.
         """
-        with open(filename, 'w') as file:
+        with span("template write", "template", file=filename), open(filename, 'w') as file:
             file.write(self.output)
@@ -0,0 +1,192 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Records wall and CPU time of stages and writes them as Chrome trace or JSON lines.
+#   with span("template load", "template", file=path):
+#       ...
+# Spans are only recorded after tracer.enable(), otherwise they cost a single attribute lookup.
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    A class used to record the duration of stages.
+
+    ...
+
+    Attributes
+    ----------
+    enabled : bool
+        whether spans are recorded
+
+    events : list
+        the recorded spans
+
+    Methods
+    -------
+    enable():
+        Starts recording spans.
+
+    span(name, category="", **args):
+        Context manager recording wall and CPU time of the enclosed code.
+
+    write(path, trace_format=None):
+        Writes the recorded spans as Chrome trace or JSON lines.
+
+    log_summary():
+        Logs the total time per span name.
+    """
+    def __init__(self):
+        """
+        Constructs a new, disabled Tracer object.
+        """
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+
+    def enable(self):
+        """
+        Starts recording spans.
+        """
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name, category="", **args):
+        """
+        Records wall time, CPU time of the thread and CPU time of child processes of the enclosed code.
+
+        Parameters
+        ----------
+        name : str
+            The name of the span.
+
+        category : str, optional
+            The category of the span, e.g. 'git' or 'http'.
+
+        **args
+            Additional values stored with the span.
+
+        Yields
+        ------
+        dict
+            The args of the span, values added to it are stored as well, e.g. the bytes transferred.
+        """
+        if not self.enabled:
+            yield args
+            return
+
+        timestamp = time.time_ns()
+        start = time.perf_counter_ns()
+        start_cpu = time.thread_time_ns()
+        start_children = os.times()
+        try:
+            yield args
+        finally:
+            end_children = os.times()
+            event = {
+                'name': name,
+                'category': category,
+                'timestamp_us': timestamp // 1000,
+                'wall_us': (time.perf_counter_ns() - start) // 1000,
+                'cpu_us': (time.thread_time_ns() - start_cpu) // 1000,
+                'child_cpu_us': int((end_children.children_user + end_children.children_system -
+                                     start_children.children_user - start_children.children_system) * 1000000),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def get_chrome_trace(self):
+        """
+        Returns the recorded spans in the Chrome trace event format.
+
+        Returns
+        -------
+        dict
+            The trace, can be loaded in chrome://tracing or Perfetto.
+        """
+        events = []
+        for e in self.events:
+            args = dict(e['args'])
+            args['child_cpu_us'] = e['child_cpu_us']
+            events.append({
+                'name': e['name'],
+                'cat': e['category'],
+                'ph': 'X',
+                'ts': e['timestamp_us'],
+                'dur': e['wall_us'],
+                'tdur': e['cpu_us'],
+                'pid': e['pid'],
+                'tid': e['tid'],
+                'args': args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path, trace_format=None):
+        """
+        Writes the recorded spans to a file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the trace file.
+
+        trace_format : str, optional
+            'chrome' or 'jsonl'. If not provided, files ending in .jsonl are written as JSON lines.
+        """
+        if trace_format is None:
+            trace_format = 'jsonl' if path.endswith('.jsonl') else 'chrome'
+        with self.lock:
+            with open(path, 'w') as f:
+                if trace_format == 'jsonl':
+                    for e in self.events:
+                        f.write(json.dumps(e) + '\n')
+                else:
+                    json.dump(self.get_chrome_trace(), f)
+        logging.debug(f"Wrote {len(self.events)} trace events to {path}")
+
+    def log_summary(self):
+        """
+        Logs the number of calls, wall and CPU time per span name in the order they first occurred.
+        """
+        totals = {}
+        for e in self.events:
+            total = totals.setdefault(e['name'], [0, 0, 0, 0])
+            total[0] += 1
+            total[1] += e['wall_us']
+            total[2] += e['cpu_us']
+            total[3] += e['child_cpu_us']
+        logging.info(f"{'stage':<40} {'calls':>6} {'wall ms':>10} {'cpu ms':>10} {'child cpu ms':>13}")
+        for name, (calls, wall, cpu, child_cpu) in totals.items():
+            logging.info(f"{name:<40} {calls:>6} {wall / 1000:>10.2f} {cpu / 1000:>10.2f} {child_cpu / 1000:>13.2f}")
+
+
+tracer = Tracer()
+
+
+def span(name, category="", **args):
+    """
+    Records a span with the global tracer, see Tracer.span.
+    """
+    return tracer.span(name, category, **args)
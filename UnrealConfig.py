@@ -19,6 +19,12 @@
 import logging
 import re
 
+from Trace import span
+
+COMMENT_PREFIXES = (';', '#')
+ARRAY_OPERATORS = ('+', '-', '.', '!')
+SECTION_PATTERN = re.compile(r'^\[.*]$')
+
 
 class UnrealConfig:
     """
@@ -32,7 +38,10 @@ class UnrealConfig:
         the path to the configuration file
 
     config : dict
-        the configuration data loaded from the file
+        the lines of every section as (key, value) tuples in file order, comments have a value of None
+
+    source : GitBlobSource
+        the repository the file is read from, or None to read it from disk
 
     Methods
     -------
@@ -42,53 +51,134 @@ class UnrealConfig:
     get(section=None, key=None):
         Returns the value for a given key in a given section. If no key is provided, returns the entire section. If no section is provided, searches all sections for the key.
 
+    get_values(section):
+        Returns the values of a section by key.
+
+    get_effective_values(section):
+        Returns the values of a section after applying the array operators.
+
     set(section, key, value):
         Sets the value for a given key in a given section.
 
     save():
         Saves the current configuration data back to the file.
     """
-    def __init__(self, path):
+    def __init__(self, path, source=None):
         """
         Constructs a new UnrealConfig object.
 
         Parameters
         ----------
         path : str
-            The path to the configuration file.
+            The path to the configuration file, or '<tree-ish>:<path>' if a source is provided.
+
+        source : GitBlobSource, optional
+            The repository to read the file from instead of the disk.
         """
         self.path = path
+        self.source = source
         self.config = self.load()
 
     def load(self):
         """
         Loads the configuration data from the file.
 
+        Every section is a list of (key, value) tuples in file order, so array operators like +Key, -Key and
+        !Key keep their meaning when the file is saved again. Comments are kept as (comment, None), comments
+        before the first section are stored in the section None.
+
         Returns
         -------
         dict
             The configuration data.
         """
-        with open(self.path, 'r') as f:
-            lines = f.readlines()
+        with span("config load", "config", file=self.path):
+            if self.source is not None:
+                lines = self.source.read(self.path).splitlines()
+            else:
+                with open(self.path, 'r') as f:
+                    lines = f.readlines()
             config = {}
+            section = None
             for line in lines:
-                if line == '\n' or line == '' or line == '\r\n':
-                    continue
                 line = line.strip()
+                if line == '':
+                    continue
+                if line.startswith(COMMENT_PREFIXES):
+                    config.setdefault(section, []).append((line, None))
                 # Regex match key=value
-                if re.match(r'^.*?=.*?$', line):
+                elif '=' in line:
+                    if section is None:
+                        logging.error(f"Line: {line}")
+                        raise Exception("Invalid INI File")
                     key, value = line.split('=', 1)
-                    config[section][key] = value
+                    config[section].append((key, value))
                 # Regex match [section]
-                elif re.match(r'^\[.*]$', line):
+                elif SECTION_PATTERN.match(line):
                     section = line[1:-1]
-                    config[section] = {}
+                    config.setdefault(section, [])
                 else:
                     logging.error(f"Line: {line}")
                     raise Exception("Invalid INI File")
             return config
 
+    def get_values(self, section):
+        """
+        Returns the values of a section by key, without comments.
+
+        Parameters
+        ----------
+        section : str
+            The section.
+
+        Returns
+        -------
+        dict
+            The value of every key, a list of values in file order if the key occurs more than once.
+        """
+        values = {}
+        for key, value in self.config.get(section, []):
+            if value is None:
+                continue
+            if key not in values:
+                values[key] = value
+            elif isinstance(values[key], list):
+                values[key].append(value)
+            else:
+                values[key] = [values[key], value]
+        return values
+
+    def get_effective_values(self, section):
+        """
+        Returns the values of a section after applying the array operators in file order: +Key adds a value
+        if it is not there yet, .Key adds it anyway, -Key removes it and !Key removes all values. Keys without
+        an operator add their value, repeated keys are how Unreal writes arrays.
+
+        Parameters
+        ----------
+        section : str
+            The section.
+
+        Returns
+        -------
+        dict
+            The values of every key without operator, in the order they were first set.
+        """
+        values = {}
+        for key, value in self.config.get(section, []):
+            if value is None:
+                continue
+            operator = key[:1] if key[:1] in ARRAY_OPERATORS else ''
+            items = values.setdefault(key[len(operator):], [])
+            if operator == '!':
+                items.clear()
+            elif operator == '-':
+                if value in items:
+                    items.remove(value)
+            elif operator != '+' or value not in items:
+                items.append(value)
+        return values
+
     def get(self, section=None, key=None):
         """
         Returns the value for a given key in a given section. If no key is provided, returns the entire section. If no section is provided, searches all sections for the key.
@@ -103,28 +193,32 @@ class UnrealConfig:
 
         Returns
         -------
-        str or dict
-            The value for the key, or the entire section.
+        str or list or dict
+            The value for the key, a list of values if the key occurs more than once, or the values of the
+            entire section by key.
         """
         if key is None:
-            return self.config[section]
+            return self.get_values(section)
         if section is None:
-            for section in self.config:
-                if key in self.config[section]:
-                    return self.config[section][key]
-                    
+            for name in self.config:
+                values = self.get_values(name)
+                if key in values:
+                    return values[key]
+
         if section not in self.config:
             logging.error(f"Section: {section} not found in config")
             return None
-        if key not in self.config[section]:
+        values = self.get_values(section)
+        if key not in values:
             logging.error(f"Key: {key} not found in section: {section}")
             return None
 
-        return self.config[section][key]
+        return values[key]
 
     def set(self, section, key, value):
         """
-        Sets the value for a given key in a given section.
+        Sets the value for a given key in a given section. The first line of the key keeps its position, further
+        lines of the same key are removed. The key is appended if the section does not contain it yet.
 
         Parameters
         ----------
@@ -137,17 +231,33 @@ class UnrealConfig:
         value : str
             The value to set.
         """
-        self.config[section][key] = value
+        lines = self.config.setdefault(section, [])
+        position = None
+        for i in reversed(range(len(lines))):
+            if lines[i][0] == key and lines[i][1] is not None:
+                if position is not None:
+                    del lines[position]
+                position = i
+        if position is None:
+            lines.append((key, value))
+        else:
+            lines[position] = (key, value)
 
     def save(self):
         """
         Saves the current configuration data back to the file.
         """
-        with open(self.path, 'w') as f:
+        if self.source is not None:
+            raise Exception(f"{self.path} was read from git and can not be saved")
+        with span("config save", "config", file=self.path), open(self.path, 'w') as f:
             for section in self.config:
-                f.write(f'[{section}]\n')
-                for key, value in self.config[section].items():
-                    f.write(f'{key}={value}\n')
+                if section is not None:
+                    f.write(f'[{section}]\n')
+                for key, value in self.config[section]:
+                    if value is None:
+                        f.write(f'{key}\n')
+                    else:
+                        f.write(f'{key}={value}\n')
                 f.write('\n')
 
     def __str__(self):
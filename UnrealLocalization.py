@@ -74,7 +74,7 @@ class UnrealLocalization:
         Exception
             If the text is not a valid Unreal Engine localization string.
         """
-        match = re.match(r'^NSLOCTEXT\("(\[.*])", "(.*)", "(.*)"\)$', text)
+        match = re.match(r'^NSLOCTEXT\("([^"]*)", "([^"]*)", "(.*)"\)$', text)
         if not match:
             logging.error(f"Line: {text}")
             return
@@ -0,0 +1,509 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Reads compiled localization data (*.locres, *.locmeta) from Content/Localization without loading whole files.
+# Checks that every NSLOCTEXT in the configuration files is translated in every culture:
+#   python UnrealLocres.py --dir /work/game --config Config/DefaultGame.ini
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from UnrealConfig import UnrealConfig
+from UnrealLocalization import UnrealLocalization
+
+LOCRES_MAGIC = struct.pack('<4I', 0x7574140E, 0xFC034A67, 0x9D90154A, 0x1B7F37C3)
+LOCMETA_MAGIC = struct.pack('<4I', 0xA14CEE4F, 0x83554868, 0xBD464C6C, 0x7C50DA70)
+
+# ELocResVersion
+LOCRES_LEGACY = 0
+LOCRES_COMPACT = 1
+LOCRES_OPTIMIZED_CRC32 = 2
+LOCRES_OPTIMIZED_CITYHASH64_UTF16 = 3
+
+# ELocMetadataVersion
+LOCMETA_ADDED_COMPILED_CULTURES = 1
+
+
+def read_fstring(data, offset):
+    """
+    Reads a serialized FString.
+
+    Parameters
+    ----------
+    data : bytes or mmap.mmap
+        The buffer.
+
+    offset : int
+        The position of the length prefix.
+
+    Returns
+    -------
+    tuple
+        The string and the position after it.
+    """
+    length, = struct.unpack_from('<i', data, offset)
+    offset += 4
+    if length == 0:
+        return "", offset
+    # A negative length is the number of UTF-16 code units, both include the terminating null
+    if length < 0:
+        end = offset - length * 2
+        return data[offset:end - 2].decode('utf-16-le'), end
+    end = offset + length
+    return data[offset:end - 1].decode('latin-1'), end
+
+
+def skip_fstring(data, offset):
+    length, = struct.unpack_from('<i', data, offset)
+    return offset + 4 + (-length * 2 if length < 0 else length)
+
+
+def read_locmeta(path):
+    """
+    Reads a *.locmeta file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file.
+
+    Returns
+    -------
+    dict
+        The native culture, the path to the native *.locres and the compiled cultures (None before version 1).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:16] != LOCMETA_MAGIC:
+        raise Exception(f"{path} is not a localization metadata file")
+    version = data[16]
+    native_culture, offset = read_fstring(data, 17)
+    native_locres, offset = read_fstring(data, offset)
+    compiled_cultures = None
+    if version >= LOCMETA_ADDED_COMPILED_CULTURES:
+        count, = struct.unpack_from('<i', data, offset)
+        offset += 4
+        compiled_cultures = []
+        for _ in range(count):
+            culture, offset = read_fstring(data, offset)
+            compiled_cultures.append(culture)
+    return {'version': version, 'native_culture': native_culture, 'native_locres': native_locres,
+            'compiled_cultures': compiled_cultures}
+
+
+class UnrealLocres:
+    """
+    A class used to read compiled Unreal Engine localization resources (*.locres).
+
+    The file is memory mapped, only the header is parsed when it is opened. The namespace and key table is
+    scanned on the first lookup, localized strings are only decoded when they are requested.
+
+    ...
+
+    Attributes
+    ----------
+    path : str
+        the path to the file
+
+    version : int
+        the format version, 0 (legacy) to 3
+
+    index : dict
+        the position of the localized string by (namespace, key), None until it is needed
+
+    Methods
+    -------
+    get(namespace, key):
+        Returns the localized string of a key, or None.
+
+    find(keys):
+        Returns the localized strings of some keys, stops reading once all are found.
+
+    iter_entries():
+        Yields namespace, key and the position of the localized string of every entry.
+
+    close():
+        Unmaps and closes the file.
+    """
+    def __init__(self, path):
+        """
+        Constructs a new UnrealLocres object and reads the header.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file.
+        """
+        self.path = path
+        self.index = None
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise Exception(f"{path} is empty")
+
+        self.version = LOCRES_LEGACY
+        offset = 0
+        if self.data[:16] == LOCRES_MAGIC:
+            self.version = self.data[16]
+            offset = 17
+        if self.version > LOCRES_OPTIMIZED_CITYHASH64_UTF16:
+            self.close()
+            raise Exception(f"{path} has the unsupported version {self.version}")
+
+        # Compact files store every distinct string once in an array, the entries refer to it by index
+        self.strings = None
+        self.strings_offset = -1
+        if self.version >= LOCRES_COMPACT:
+            self.strings_offset, = struct.unpack_from('<q', self.data, offset)
+            offset += 8
+        if self.version >= LOCRES_OPTIMIZED_CRC32:
+            self.entry_count, = struct.unpack_from('<I', self.data, offset)
+            offset += 4
+        else:
+            self.entry_count = None
+        self.entries_offset = offset
+
+    def get_string_offsets(self):
+        """
+        Returns the positions of the strings in the string array without decoding them.
+
+        Returns
+        -------
+        list
+            The position of every string, empty if the file has no string array.
+        """
+        if self.strings is not None:
+            return self.strings
+        if self.strings_offset == -1:
+            self.strings = []
+            return self.strings
+        offset = self.strings_offset
+        count, = struct.unpack_from('<i', self.data, offset)
+        offset += 4
+        offsets = []
+        for _ in range(count):
+            offsets.append(offset)
+            offset = skip_fstring(self.data, offset)
+            if self.version >= LOCRES_OPTIMIZED_CRC32:
+                # Reference count
+                offset += 4
+        self.strings = offsets
+        return self.strings
+
+    def iter_entries(self):
+        """
+        Yields namespace, key and the position of the localized string of every entry.
+
+        Yields
+        ------
+        tuple
+            The namespace, the key and the position of the localized string.
+        """
+        data = self.data
+        hashed = self.version >= LOCRES_OPTIMIZED_CRC32
+        strings = self.get_string_offsets() if self.version >= LOCRES_COMPACT else None
+        offset = self.entries_offset
+        namespace_count, = struct.unpack_from('<I', data, offset)
+        offset += 4
+        for _ in range(namespace_count):
+            if hashed:
+                offset += 4
+            namespace, offset = read_fstring(data, offset)
+            key_count, = struct.unpack_from('<I', data, offset)
+            offset += 4
+            for _ in range(key_count):
+                if hashed:
+                    offset += 4
+                key, offset = read_fstring(data, offset)
+                # Hash of the source string
+                offset += 4
+                if self.version >= LOCRES_COMPACT:
+                    string_index, = struct.unpack_from('<i', data, offset)
+                    offset += 4
+                    if not 0 <= string_index < len(strings):
+                        logging.warning(f"{self.path}: {namespace},{key} refers to the missing string {string_index}")
+                        continue
+                    yield namespace, key, strings[string_index]
+                else:
+                    yield namespace, key, offset
+                    offset = skip_fstring(data, offset)
+
+    def load_index(self):
+        """
+        Scans the namespace and key table once.
+
+        Returns
+        -------
+        dict
+            The position of the localized string by (namespace, key).
+        """
+        if self.index is None:
+            self.index = {(namespace, key): offset for namespace, key, offset in self.iter_entries()}
+            logging.debug(f"Indexed {len(self.index)} entries of {self.path}")
+        return self.index
+
+    def get(self, namespace, key):
+        """
+        Returns the localized string of a key.
+
+        Parameters
+        ----------
+        namespace : str
+            The namespace.
+
+        key : str
+            The key.
+
+        Returns
+        -------
+        str or None
+            The localized string, or None if the key does not exist.
+        """
+        offset = self.load_index().get((namespace, key))
+        if offset is None:
+            return None
+        return read_fstring(self.data, offset)[0]
+
+    def find(self, keys):
+        """
+        Returns the localized strings of some keys. Without an index the table is only read until all keys
+        are found.
+
+        Parameters
+        ----------
+        keys : iterable
+            The (namespace, key) tuples to look for.
+
+        Returns
+        -------
+        dict
+            The localized string by (namespace, key) of every key that exists.
+        """
+        wanted = set(keys)
+        if self.index is not None:
+            return {k: read_fstring(self.data, self.index[k])[0] for k in wanted if k in self.index}
+
+        found = {}
+        for namespace, key, offset in self.iter_entries():
+            if (namespace, key) in wanted:
+                found[(namespace, key)] = read_fstring(self.data, offset)[0]
+                if len(found) == len(wanted):
+                    break
+        return found
+
+    def close(self):
+        """
+        Unmaps and closes the file.
+        """
+        self.data.close()
+        self.file.close()
+
+    def __len__(self):
+        return len(self.load_index())
+
+    def __contains__(self, item):
+        return item in self.load_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_config_texts(config_paths):
+    """
+    Returns every NSLOCTEXT value of the configuration files.
+
+    Parameters
+    ----------
+    config_paths : list
+        The paths to the configuration files.
+
+    Returns
+    -------
+    list
+        The namespace, key, source string and location of every localized value.
+    """
+    texts = []
+    for path in config_paths:
+        config = UnrealConfig(path)
+        for section, lines in config.config.items():
+            for key, value in lines:
+                if value is None or not value.startswith('NSLOCTEXT('):
+                    continue
+                localization = UnrealLocalization(value)
+                if localization.key is not None:
+                    texts.append({'namespace': localization.namespace, 'key': localization.key,
+                                  'source': localization.value, 'config': path, 'section': section,
+                                  'name': key})
+    return texts
+
+
+def get_cultures(localization_dir):
+    """
+    Returns the *.locres files of every culture of every localization target.
+
+    Parameters
+    ----------
+    localization_dir : str
+        The localization directory, e.g. Content/Localization.
+
+    Returns
+    -------
+    dict
+        The paths to the *.locres files by culture.
+    """
+    cultures = {}
+    for target in sorted(os.listdir(localization_dir)):
+        target_dir = os.path.join(localization_dir, target)
+        if not os.path.isdir(target_dir):
+            continue
+        compiled_cultures = None
+        locmeta = os.path.join(target_dir, target + '.locmeta')
+        if os.path.isfile(locmeta):
+            compiled_cultures = read_locmeta(locmeta)['compiled_cultures']
+        if compiled_cultures is None:
+            compiled_cultures = sorted(c for c in os.listdir(target_dir) if os.path.isdir(os.path.join(target_dir, c)))
+        for culture in compiled_cultures:
+            cultures.setdefault(culture, []).append(os.path.join(target_dir, culture, target + '.locres'))
+    return cultures
+
+
+def verify_culture(culture, locres_paths, keys):
+    """
+    Checks that the keys are translated in one culture.
+
+    Parameters
+    ----------
+    culture : str
+        The culture, e.g. 'de'.
+
+    locres_paths : list
+        The *.locres files of all localization targets for the culture.
+
+    keys : list
+        The (namespace, key) tuples to look for.
+
+    Returns
+    -------
+    dict
+        The culture, the missing and empty keys and the files that could not be read.
+    """
+    found = {}
+    errors = []
+    for path in locres_paths:
+        remaining = [k for k in keys if k not in found]
+        if not remaining:
+            break
+        if not os.path.isfile(path):
+            errors.append(f"{path} does not exist")
+            continue
+        try:
+            with UnrealLocres(path) as locres:
+                found.update(locres.find(remaining))
+        except Exception as e:
+            errors.append(f"{path}: {e}")
+    return {
+        'culture': culture,
+        'missing': [list(k) for k in keys if k not in found],
+        'empty': [list(k) for k in keys if found.get(k) == ""],
+        'errors': errors
+    }
+
+
+def verify_translations(localization_dir, texts, workers=None):
+    """
+    Checks that every localized config value is translated in every culture, one culture per worker process.
+
+    Parameters
+    ----------
+    localization_dir : str
+        The localization directory, e.g. Content/Localization.
+
+    texts : list
+        The localized values, see get_config_texts.
+
+    workers : int, optional
+        The number of worker processes. If not provided, uses the number of cores.
+
+    Returns
+    -------
+    list
+        The result of every culture, see verify_culture.
+    """
+    keys = list(dict.fromkeys((t['namespace'], t['key']) for t in texts))
+    cultures = get_cultures(localization_dir)
+    logging.info(f"Checking {len(keys)} keys in {len(cultures)} cultures")
+    workers = min(workers or os.cpu_count() or 1, max(1, len(cultures)))
+    if workers == 1:
+        return [verify_culture(culture, paths, keys) for culture, paths in cultures.items()]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(verify_culture, culture, paths, keys) for culture, paths in cultures.items()]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Checks that the localized config values are translated '
+                                                 'in every culture')
+    parser.add_argument('--dir', type=str, help='Project directory', required=True)
+    parser.add_argument('--config', type=str, action='append', default=None,
+                        help='Configuration file relative to the project, can be given more than once, '
+                             'defaults to Config/DefaultGame.ini')
+    parser.add_argument('--localization', type=str, default="Content/Localization",
+                        help='Localization directory relative to the project')
+    parser.add_argument('--dump', type=str, default=None, help='Print all entries of a *.locres file and exit')
+    parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the number of cores',
+                        default=None)
+    parser.add_argument('--output', type=str, help='File to write the results to as JSON', default=None)
+    parser.add_argument('--log', type=str, help='Log level', default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    if args.dump is not None:
+        with UnrealLocres(args.dump) as dump:
+            for entry_namespace, entry_key, entry_offset in dump.iter_entries():
+                print(json.dumps([entry_namespace, entry_key, read_fstring(dump.data, entry_offset)[0]],
+                                 ensure_ascii=False))
+        sys.exit(0)
+
+    config_files = [os.path.join(args.dir, c) for c in args.config or ["Config/DefaultGame.ini"]]
+    config_texts = get_config_texts(config_files)
+    results = verify_translations(os.path.join(args.dir, args.localization), config_texts, args.workers)
+
+    failed = False
+    for result in results:
+        for namespace_key in result['missing']:
+            logging.error(f"{result['culture']}: {namespace_key[0]},{namespace_key[1]} is not translated")
+        for namespace_key in result['empty']:
+            logging.warning(f"{result['culture']}: {namespace_key[0]},{namespace_key[1]} is empty")
+        for error in result['errors']:
+            logging.error(f"{result['culture']}: {error}")
+        failed = failed or bool(result['missing'] or result['errors'])
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'texts': config_texts, 'cultures': results}, f, indent=4, ensure_ascii=False)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,492 @@
+"""
+    UEBuild Tools - Version Information Updater for Unreal Engine
+    Copyright (C) 2024 IT-Hock
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published
+    by the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+# Keeps the version information of a repository in memory, regenerates the outputs when HEAD or a ref
+# changes and answers queries on a unix socket:
+#   python main.py --dir /path/to/repo --game Game --daemon
+#   python VersionDaemon.py --socket /path/to/repo/.git/uebuildtools.sock version
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+
+from BuildManifest import BuildManifest, get_git_dir, get_git_state
+from Template import Template
+from UnrealConfig import UnrealConfig
+from VersionInformation import VersionInformation
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class RefWatcher:
+    """
+    A class used to wait for changes of HEAD, the refs and packed-refs of a repository.
+
+    ...
+
+    Attributes
+    ----------
+    repo_dir : str
+        the path to the working tree
+
+    state : dict
+        the git state as returned by BuildManifest.get_git_state
+
+    Methods
+    -------
+    wait(timeout=None):
+        Blocks until the git state changed or the timeout passed.
+
+    close():
+        Stops watching.
+    """
+    def __init__(self, repo_dir, interval=1.0):
+        """
+        Constructs a new RefWatcher object. Uses inotify on Linux and polls every interval seconds elsewhere.
+
+        Parameters
+        ----------
+        repo_dir : str
+            The path to the working tree.
+
+        interval : float, optional
+            The polling interval if inotify is not available.
+        """
+        self.repo_dir = repo_dir
+        self.interval = interval
+        self.git_dir, self.common_dir = get_git_dir(repo_dir)
+        self.state = get_git_state(repo_dir)
+        self.fd = None
+        self.libc = None
+        self.watches = {}
+        try:
+            self.init_inotify()
+        except (OSError, AttributeError) as e:
+            logging.info(f"inotify not available ({e}), polling every {interval} seconds")
+            self.fd = None
+
+    def init_inotify(self):
+        """
+        Creates an inotify instance watching the git directories and all directories below refs.
+        """
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.fd = fd
+        for path in {self.git_dir, self.common_dir}:
+            self.add_watch(path)
+        for root, dirs, files in os.walk(os.path.join(self.common_dir, 'refs')):
+            self.add_watch(root)
+
+    def add_watch(self, path):
+        """
+        Adds an inotify watch for a directory.
+
+        Parameters
+        ----------
+        path : str
+            The directory to watch.
+        """
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            logging.warning(f"Could not watch {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = path
+
+    def read_events(self):
+        """
+        Reads all pending inotify events and watches newly created ref directories.
+        """
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self.watches:
+                    path = os.path.join(self.watches[wd], os.fsdecode(name))
+                    if path.startswith(os.path.join(self.common_dir, 'refs')):
+                        self.add_watch(path)
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the git state changed or the timeout passed.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum number of seconds to wait. If not provided, waits forever.
+
+        Returns
+        -------
+        bool
+            True if the git state changed, False if the timeout passed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if self.fd is not None:
+                readable, _, _ = select.select([self.fd], [], [], remaining)
+                if readable:
+                    # git writes refs through lock files, give it a moment to finish the rename
+                    time.sleep(0.05)
+                    self.read_events()
+            else:
+                time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+
+            try:
+                state = get_git_state(self.repo_dir)
+            except OSError:
+                state = self.state
+            if state != self.state:
+                self.state = state
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        """
+        Stops watching.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class VersionDaemon:
+    """
+    A class used to keep the version information, template and configuration files of a repository in memory.
+
+    ...
+
+    Attributes
+    ----------
+    args : argparse.Namespace
+        the arguments of main.py
+
+    socket_path : str
+        the unix socket queries are answered on
+
+    version_information : VersionInformation
+        the version information of the open repository
+
+    response : bytes
+        the current version information as JSON, sent to clients
+
+    Methods
+    -------
+    regenerate(force=False):
+        Writes the outputs if the version information changed.
+
+    update():
+        Reads the version information again and regenerates the outputs, raises if that fails.
+
+    serve_forever():
+        Answers queries and regenerates the outputs whenever a ref changes.
+    """
+    def __init__(self, args):
+        """
+        Constructs a new VersionDaemon object and opens the repository.
+
+        Parameters
+        ----------
+        args : argparse.Namespace
+            The arguments of main.py.
+        """
+        # main is imported here, it imports this module when started with --daemon
+        import main
+
+        self.main = main
+        self.args = args
+        self.main.resolve_default_paths(args)
+        self.socket_path = args.socket
+        if self.socket_path is None:
+            self.socket_path = os.path.join(get_git_dir(args.dir)[0], 'uebuildtools.sock')
+        self.version_information = VersionInformation(args.dir, args.build_number, args.write_commit_graph,
+                                                      args.version_sidecar)
+        self.manifest = BuildManifest(args.manifest) if args.manifest is not None else None
+        self.template = None
+        self.configs = {}
+        self.variables = None
+        self.response = b'{}\n'
+        self.lock = threading.Lock()
+
+    def get_template(self):
+        """
+        Returns the parsed template, loading it again if the file changed.
+
+        Returns
+        -------
+        Template
+            The template.
+        """
+        mtime = os.stat(self.args.template).st_mtime_ns
+        if self.template is None or self.template[1] != mtime:
+            self.template = (Template(self.args.template), mtime)
+        return self.template[0]
+
+    def get_config(self, path):
+        """
+        Returns a parsed configuration file, loading it again if the file was changed by someone else.
+
+        Parameters
+        ----------
+        path : str
+            The path to the configuration file.
+
+        Returns
+        -------
+        UnrealConfig
+            The configuration.
+        """
+        mtime = os.stat(path).st_mtime_ns
+        if path not in self.configs or self.configs[path][1] != mtime:
+            self.configs[path] = (UnrealConfig(path), mtime)
+        return self.configs[path][0]
+
+    def saved_config(self, path):
+        """
+        Remembers the modification time of a configuration file written by the daemon.
+
+        Parameters
+        ----------
+        path : str
+            The path to the configuration file.
+        """
+        self.configs[path] = (self.configs[path][0], os.stat(path).st_mtime_ns)
+
+    def get_information(self):
+        """
+        Returns the current version information as a dict.
+
+        Returns
+        -------
+        dict
+            The version information.
+        """
+        version_information = self.version_information
+        return {
+            'sha': version_information.sha,
+            'short_sha': version_information.short_sha,
+            'branch': version_information.branch,
+            'version': version_information.version,
+            'version_long': version_information.get_version_long(),
+            'version_string': version_information.get_version_string(),
+            'visibility': version_information.get_visibility(),
+            'commit_date': version_information.commit_date.isoformat(),
+            'variables': self.main.get_template_variables(version_information)
+        }
+
+    def regenerate(self, force=False):
+        """
+        Writes the outputs if the version information changed since the last call.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Writes the outputs even if nothing changed.
+
+        Returns
+        -------
+        bool
+            True if the outputs were written, False otherwise.
+        """
+        information = self.get_information()
+        self.response = (json.dumps(information) + '\n').encode('utf-8')
+        if not force and information == self.variables:
+            logging.info("Version information did not change")
+            return False
+
+        args = self.args
+        version_information = self.version_information
+        if not os.path.isfile(args.template):
+            logging.error(f"Template file {args.template} not found")
+            return False
+        self.main.modify_template_file(version_information, args.template, args.output, self.get_template())
+
+        if not args.no_update_crash_report_client and os.path.isfile(args.crash_report_client):
+            self.main.modify_crash_report_client(version_information, args.crash_report_client,
+                                                 self.get_config(args.crash_report_client))
+            self.saved_config(args.crash_report_client)
+
+        if not args.no_update_default_game and os.path.isfile(args.default_game):
+            self.main.modify_default_game(version_information, args.game, args.default_game,
+                                          self.get_config(args.default_game))
+            self.saved_config(args.default_game)
+
+        if self.manifest is not None:
+            self.manifest.record(args.dir, self.main.get_manifest_arguments(args), self.main.get_manifest_files(args))
+            self.manifest.save()
+
+        self.variables = information
+        logging.info(f"Regenerated version information for {version_information.get_version_long()}")
+        return True
+
+    def update(self):
+        """
+        Reads the version information again and regenerates the outputs.
+        """
+        with self.lock:
+            self.version_information.refresh()
+            self.regenerate()
+
+    def create_server(self):
+        """
+        Creates the unix socket server answering queries.
+
+        Returns
+        -------
+        socketserver.ThreadingUnixStreamServer
+            The server.
+        """
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                command = self.rfile.readline().strip()
+                if command in (b'', b'version'):
+                    self.wfile.write(daemon.response)
+                elif command == b'refresh':
+                    try:
+                        daemon.update()
+                    except Exception as e:
+                        logging.error(f"Could not update version information: {e!r}")
+                        self.wfile.write((json.dumps({'error': str(e)}) + '\n').encode('utf-8'))
+                        return
+                    self.wfile.write(daemon.response)
+                elif command == b'ping':
+                    self.wfile.write(b'pong\n')
+                else:
+                    self.wfile.write(b'{"error": "unknown command"}\n')
+
+        if os.path.exists(self.socket_path):
+            try:
+                query(self.socket_path, 'ping')
+                raise Exception(f"A daemon is already listening on {self.socket_path}")
+            except OSError:
+                os.remove(self.socket_path)
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        server.daemon_threads = True
+        return server
+
+    def serve_forever(self):
+        """
+        Answers queries and regenerates the outputs whenever HEAD or a ref changes.
+
+        Returns
+        -------
+        int
+            The exit code.
+        """
+        with self.lock:
+            self.regenerate(force=True)
+        watcher = RefWatcher(self.args.dir)
+        server = self.create_server()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        logging.info(f"Listening on {self.socket_path}")
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            while True:
+                if watcher.wait():
+                    logging.info("Git refs changed, updating version information")
+                    # Mid-checkout or mid-rebase files and refs may be half written, the next change retries and
+                    # clients get the last good version information until then
+                    try:
+                        self.update()
+                    except Exception as e:
+                        logging.error(f"Could not update version information: {e!r}")
+        except KeyboardInterrupt:
+            logging.info("Stopping")
+        finally:
+            server.shutdown()
+            server.server_close()
+            watcher.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        return 0
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def query(socket_path, command='version'):
+    """
+    Sends a command to a running daemon and returns the answer.
+
+    Parameters
+    ----------
+    socket_path : str
+        The unix socket the daemon listens on.
+
+    command : str, optional
+        'version', 'refresh' or 'ping'.
+
+    Returns
+    -------
+    str
+        The answer of the daemon.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(command.encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = client.recv(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks).decode('utf-8')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Queries a running version daemon')
+    parser.add_argument('--socket', type=str, help='Unix socket the daemon listens on', required=True)
+    parser.add_argument('command', nargs='?', default='version', choices=['version', 'refresh', 'ping'])
+    args = parser.parse_args()
+
+    try:
+        sys.stdout.write(query(args.socket, args.command))
+    except OSError as e:
+        sys.stderr.write(f"Could not connect to {args.socket}: {e}\n")
+        sys.exit(1)
@@ -16,10 +16,13 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 import argparse
+import atexit
 import logging
 import os
 
+from BuildManifest import BuildManifest
 from Template import Template
+from Trace import span, tracer
 from UnrealConfig import UnrealConfig
 from UnrealLocalization import UnrealLocalization
 from VersionInformation import VersionInformation
@@ -41,11 +44,18 @@ def get_template_variables(version_information):
     }
 
 
-def modify_default_game(version_information, project_name, default_game_path="DefaultGame.ini"):
+def modify_default_game(version_information, project_name, default_game_path="DefaultGame.ini",
+                        default_game_config=None):
     logging.info(f"Updating Unreal Engine configuration files")
-    default_game_config = UnrealConfig(default_game_path)
+    if default_game_config is None:
+        default_game_config = UnrealConfig(default_game_path)
 
     default_project_displayed_title = default_game_config.get("/Script/EngineSettings.GeneralProjectSettings", "ProjectDisplayedTitle")
+    if isinstance(default_project_displayed_title, list):
+        # The last line wins in Unreal, set() below replaces all of them with a single line
+        logging.warning(f"ProjectDisplayedTitle is set {len(default_project_displayed_title)} times in "
+                        f"{default_game_path}, using the last one")
+        default_project_displayed_title = default_project_displayed_title[-1]
     if default_project_displayed_title is not None:
         unreal_localization = UnrealLocalization(default_project_displayed_title)
         unreal_localization.value = f"{project_name} {version_information.get_version_string()}"
@@ -55,27 +65,33 @@ def modify_default_game(version_information, project_name, default_game_path="De
                             f"{version_information.version[0]}.{version_information.version[1]}.{version_information.version[2]}")
     default_game_config.save()
     logging.info(f"Done updating Unreal Engine configuration files")
+    return default_game_config
 
 
-def modify_template_file(version_information, template_file="version.tpl", output_file="version.h"):
-    logging.info(f"Loading template file {template_file} and replacing variables")
-    template = Template(template_file)
+def modify_template_file(version_information, template_file="version.tpl", output_file="version.h", template=None):
+    if template is None:
+        logging.info(f"Loading template file {template_file} and replacing variables")
+        template = Template(template_file)
     template.set_variables(get_template_variables(version_information))
     template.replace()
     logging.info(f"Writing version information to {output_file}")
     template.write(output_file)
+    return template
 
 
-def modify_crash_report_client(version_information, crash_report_client_path="CrashReportClient.ini"):
+def modify_crash_report_client(version_information, crash_report_client_path="CrashReportClient.ini",
+                               crash_report_client_config=None):
     logging.info(f"Updating Crash Report Client Version")
-    crash_report_client_config = UnrealConfig(crash_report_client_path)
+    if crash_report_client_config is None:
+        crash_report_client_config = UnrealConfig(crash_report_client_path)
     crash_report_client_config.set("CrashReportClient", "CrashReportClientVersion",
                                    version_information.get_version_long())
     crash_report_client_config.save()
     logging.info(f"Done updating Crash Report Client Version")
+    return crash_report_client_config
 
 
-if __name__ == "__main__":
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(description='')
     parser.add_argument('--dir', type=str, help='Git repository directory', required=True)
     parser.add_argument('--game', type=str, help='Game name', required=True)
@@ -88,12 +104,52 @@ if __name__ == "__main__":
                         default="CrashReportClient.ini")
     parser.add_argument('--no-update-crash-report-client', action='store_true',
                         help='Do not update CrashReportClient.ini file')
-    args = parser.parse_args()
+    parser.add_argument('--build-number', type=str, choices=['tag', 'commits', 'first-parent'], default='tag',
+                        help='Build component of the version: from the tag, commits since the nearest version tag '
+                             'or commits on the first-parent chain')
+    parser.add_argument('--write-commit-graph', action='store_true',
+                        help='Write a commit-graph before counting commits if the repository has none')
+    parser.add_argument('--version-sidecar', type=str, default=None,
+                        help='JSON file with precomputed versions per commit, updated in full clones and read in '
+                             'shallow clones')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Manifest file, skips the run if nothing changed since the last one')
+    parser.add_argument('--force', action='store_true', help='Run even if the manifest is up to date')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running, regenerate on ref changes and answer queries on --socket')
+    parser.add_argument('--socket', type=str, default=None,
+                        help='Unix socket the daemon listens on, defaults to uebuildtools.sock in the git directory')
+    parser.add_argument('--timings', action='store_true', help='Log wall and CPU time per stage')
+    parser.add_argument('--trace-json', type=str, default=None,
+                        help='Write a trace of all stages, as JSON lines if the file ends in .jsonl')
+    parser.add_argument('--trace-format', type=str, choices=['chrome', 'jsonl'], default=None,
+                        help='Format of --trace-json')
+    return parser.parse_args(argv)
+
+
+def write_version_information(git_version, args):
+    # check if a file is present in file system
+    if not os.path.isfile(args.template):
+        logging.error(f"Template file {args.template} not found")
+        return False
 
-    logging.basicConfig(level=args.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+    modify_template_file(git_version, args.template, args.output)
 
-    logging.info(f'Updating Version Informations for "{args.game}" using git repository in {args.dir}')
+    if not args.no_update_crash_report_client:
+        if not os.path.isfile(args.crash_report_client):
+            logging.error(f"CrashReportClient file {args.crash_report_client} not found")
+        else:
+            modify_crash_report_client(git_version, args.crash_report_client)
+
+    if not args.no_update_default_game:
+        if not os.path.isfile(args.default_game):
+            logging.error(f"DefaultGame file {args.default_game} not found")
+        else:
+            modify_default_game(git_version, args.game, args.default_game)
+    return True
 
+
+def resolve_default_paths(args):
     if args.default_game is None and not args.no_update_default_game:
         args.default_game = args.dir + "/Config/DefaultGame.ini"
         logging.info(f"DefaultGame.ini file not specified, using {args.default_game}")
@@ -102,29 +158,87 @@ if __name__ == "__main__":
         args.crash_report_client = args.dir + "/Config/CrashReportClient.ini"
         logging.info(f"CrashReportClient.ini file not specified, using {args.crash_report_client}")
 
+
+def get_manifest_arguments(args):
+    # Arguments that do not change the generated files
+    ignored = ("log", "manifest", "force", "daemon", "socket", "timings", "trace_json", "trace_format",
+               "write_commit_graph")
+    return {key: value for key, value in vars(args).items() if key not in ignored}
+
+
+def get_manifest_files(args):
+    files = [args.template, args.output]
+    if not args.no_update_crash_report_client:
+        files.append(args.crash_report_client)
+    if not args.no_update_default_game:
+        files.append(args.default_game)
+    # Shallow clones read their version from it
+    if args.version_sidecar is not None:
+        files.append(args.version_sidecar)
+    return files
+
+
+def update_version_information(args, report=None):
+    if report is None:
+        report = {}
+    logging.info(f'Updating Version Informations for "{args.game}" using git repository in {args.dir}')
+
+    resolve_default_paths(args)
+
+    manifest = None
+    manifest_arguments = get_manifest_arguments(args)
+    manifest_files = get_manifest_files(args)
+    if args.manifest is not None:
+        with span("manifest check", "manifest"):
+            manifest = BuildManifest(args.manifest)
+            up_to_date = not args.force and manifest.is_up_to_date(args.dir, manifest_arguments, manifest_files)
+        if up_to_date:
+            logging.info(f"Version information is up to date, nothing to do")
+            report["up_to_date"] = True
+            return 0
+
     logging.info(f"Git repository directory: {args.dir}")
     logging.info(f"Reading version information from git repository")
-    git_version = VersionInformation(args.dir)
+    with span("version information", "git"):
+        git_version = VersionInformation(args.dir, args.build_number, args.write_commit_graph,
+                                         args.version_sidecar)
     logging.debug(f"SHA: {git_version.sha}")
     logging.debug(f"Short SHA: {git_version.short_sha}")
+    report["version"] = git_version.get_version_long()
+    report["branch"] = git_version.branch
+    report["sha"] = git_version.sha
 
-    # check if a file is present in file system
-    if not os.path.isfile(args.template):
-        logging.error(f"Template file {args.template} not found")
-        exit(1)
+    with span("write outputs", "main"):
+        if not write_version_information(git_version, args):
+            return 1
 
-    modify_template_file(git_version, args.template, args.output)
+    if manifest is not None:
+        with span("manifest record", "manifest"):
+            manifest.record(args.dir, manifest_arguments, manifest_files)
+            manifest.save()
 
-    if not args.no_update_crash_report_client:
-        if not os.path.isfile(args.crash_report_client):
-            logging.error(f"CrashReportClient file {args.crash_report_client} not found")
-        else:
-            modify_crash_report_client(git_version, args.crash_report_client)
+    logging.info(f"Done")
+    return 0
 
-    if not args.no_update_default_game:
-        if not os.path.isfile(args.default_game):
-            logging.error(f"DefaultGame file {args.default_game} not found")
-        else:
-            modify_default_game(git_version, args.game, args.default_game)
 
-    logging.info(f"Done")
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    logging.basicConfig(level=arguments.log, format='[%(asctime)s] [%(levelname)-8s] %(message)s')
+
+    if arguments.timings or arguments.trace_json:
+        tracer.enable()
+        # Written at exit, so a run that raises and the daemon still leave a trace, like TeamCity.py
+        if arguments.timings:
+            atexit.register(tracer.log_summary)
+        if arguments.trace_json:
+            atexit.register(tracer.write, arguments.trace_json, arguments.trace_format)
+
+    if arguments.daemon:
+        from VersionDaemon import VersionDaemon
+
+        exit(VersionDaemon(arguments).serve_forever())
+
+    with span("main", "main"):
+        exit_code = update_version_information(arguments)
+    exit(exit_code)